@@ -1,21 +1,23 @@
 """
 API endpoints for document transformation.
 """
+import asyncio
 import logging
-import uuid
-import shutil
+import os
+import sys
 from pathlib import Path
-from typing import Annotated, Literal
+from typing import Annotated, Any, BinaryIO, Literal
 
-from fastapi import APIRouter, File, Form, UploadFile, HTTPException, BackgroundTasks
+import uuid6
+from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException, BackgroundTasks, Request
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
 from app.core.config import get_settings
 from app.core.exceptions import (
     BaseAppException,
-    UnsupportedFileTypeError,
-    PlaceholderNotFoundError,
+    FileTooLargeError,
+    ParsingError,
     AIMapperError,
     RenderingError,
 )
@@ -23,18 +25,29 @@ from app.services.parser import extract_content
 from app.services.analyzer import analyze_template
 from app.services.ai_mapper import map_content_to_placeholders
 from app.services.renderer import render_document
-from app.services.pdf_converter import convert_docx_to_pdf
+from app.services.pdf_converter import PDFConversionError, convert_docx_to_pdf
+from app.services.job_queue import JobQueue, JobStatus
+from app.services.temp_sweeper import DOWNLOADS_DIRNAME, schedule_removal
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+# Download media types keyed by lowercase extension (without the dot)
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "pdf": "application/pdf",
+}
+
+
 class ProcessResponse(BaseModel):
     """Response model for process endpoint."""
     success: bool
     message: str
     download_url: str | None = None
     job_id: str | None = None
+    status_url: str | None = None
 
 
 class ErrorResponse(BaseModel):
@@ -44,109 +57,176 @@ class ErrorResponse(BaseModel):
     details: str | None = None
 
 
-def get_temp_dir() -> Path:
-    """Get or create temporary directory."""
-    settings = get_settings()
-    temp_dir = Path(settings.temp_dir)
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    return temp_dir
+def get_temp_dir(request: Request) -> Path:
+    """Temporary directory, created and resolved once at startup."""
+    return request.app.state.temp_dir
+
+
+def get_supported_extensions(request: Request) -> frozenset[str]:
+    """Supported upload extensions, resolved once at startup."""
+    return request.app.state.supported_extensions
+
+
+def get_max_upload_bytes(request: Request) -> int:
+    """Maximum upload size in bytes, resolved once at startup."""
+    return request.app.state.max_upload_bytes
 
 
-def validate_file(file: UploadFile, label: str) -> None:
+def _check_upload(file: UploadFile, label: str, supported_extensions: frozenset[str]) -> UploadFile:
     """
     Validate uploaded file.
     
     Args:
         file: The uploaded file
         label: Label for error messages (e.g., "normal_file")
+        supported_extensions: Allowed lowercase extensions (e.g., ".docx")
         
     Raises:
         HTTPException: If validation fails
     """
-    settings = get_settings()
-    
     if not file.filename:
         raise HTTPException(status_code=400, detail=f"{label}: No filename provided")
     
-    ext = Path(file.filename).suffix.lower()
-    if ext not in settings.supported_extensions:
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in supported_extensions:
         raise HTTPException(
             status_code=400,
-            detail=f"{label}: Unsupported file type '{ext}'. Supported: {settings.supported_extensions}"
+            detail=f"{label}: Unsupported file type '{ext}'. Supported: {sorted(supported_extensions)}"
         )
+    return file
 
 
-async def save_upload(file: UploadFile, job_id: str, prefix: str) -> Path:
-    """Save uploaded file to temp directory."""
-    temp_dir = get_temp_dir()
-    job_dir = temp_dir / job_id
-    job_dir.mkdir(parents=True, exist_ok=True)
+def validated_normal_file(
+    normal_file: Annotated[UploadFile, File(description="Source document (DOCX, PDF, or PPTX)")],
+    supported_extensions: Annotated[frozenset[str], Depends(get_supported_extensions)],
+) -> UploadFile:
+    """Dependency: the validated source document upload."""
+    return _check_upload(normal_file, "normal_file", supported_extensions)
+
+
+def validated_target_file(
+    target_file: Annotated[UploadFile, File(description="Template document with {{PLACEHOLDERS}} (DOCX or PPTX)")],
+    supported_extensions: Annotated[frozenset[str], Depends(get_supported_extensions)],
+) -> UploadFile:
+    """Dependency: the validated template document upload."""
+    return _check_upload(target_file, "target_file", supported_extensions)
+
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+
+# os.sendfile can target a regular file only on Linux (macOS requires a socket)
+_SENDFILE_TO_FILE = sys.platform.startswith("linux")
+
+
+def _sendfile_copy(src: BinaryIO, out: BinaryIO, max_bytes: int, too_large: Exception) -> None:
+    """Copy the rest of a disk-backed file into out entirely in-kernel."""
+    in_fd = src.fileno()
+    offset = src.tell()
+    size = os.fstat(in_fd).st_size - offset
+    if size > max_bytes:
+        raise too_large
+    end = offset + size
+    while offset < end:
+        sent = os.sendfile(out.fileno(), in_fd, offset, end - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def _copy_upload(src: BinaryIO, out_path: Path, max_bytes: int, too_large: Exception) -> None:
+    """Copy an upload's spool to out_path, up to max_bytes."""
+    with open(out_path, "wb") as out:
+        # A spool that rolled over to disk has a name (in memory it is None);
+        # checking it, unlike fileno(), doesn't force a rollover
+        if _SENDFILE_TO_FILE and getattr(src, "name", None) is not None:
+            try:
+                _sendfile_copy(src, out, max_bytes, too_large)
+                return
+            except OSError as e:
+                # sendfile doesn't move src's position, so the chunked copy starts clean
+                logger.debug(f"sendfile failed ({e}), copying in chunks")
+                out.seek(0)
+                out.truncate()
+        
+        written = 0
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > max_bytes:
+                raise too_large
+            out.write(chunk)
+
+
+async def save_upload(file: UploadFile, job_dir: Path, prefix: str, max_bytes: int) -> Path:
+    """
+    Save uploaded file into the job directory.
+    
+    The whole copy runs in one worker thread rather than hopping threads
+    for every chunk. Uploads Starlette has spooled to disk are copied with
+    os.sendfile on Linux; in-memory uploads, other platforms and sendfile
+    failures use a chunked read/write loop.
     
+    Raises:
+        FileTooLargeError: If the upload exceeds max_bytes
+    """
     ext = Path(file.filename).suffix.lower()
     file_path = job_dir / f"{prefix}{ext}"
+    too_large = FileTooLargeError(
+        f"{file.filename}: File exceeds maximum size of {max_bytes // (1024 * 1024)} MB"
+    )
     
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    # Starlette records the size while parsing, so oversized uploads fail fast
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
     
+    await asyncio.to_thread(_copy_upload, file.file, file_path, max_bytes, too_large)
     return file_path
 
 
-def cleanup_job(job_id: str) -> None:
-    """Clean up temporary files for a job."""
-    temp_dir = get_temp_dir()
-    job_dir = temp_dir / job_id
-    if job_dir.exists():
-        shutil.rmtree(job_dir)
+def cleanup_job(job_dir: Path) -> None:
+    """Schedule temporary files for a job for background removal."""
+    schedule_removal(job_dir)
 
 
-@router.post(
-    "/process",
-    response_model=ProcessResponse,
-    responses={
-        400: {"model": ErrorResponse},
-        500: {"model": ErrorResponse},
-    },
-    summary="Process and transform documents",
-    description="Upload a source document and a template. The content from the source will be mapped to placeholders in the template."
-)
-async def process_documents(
-    background_tasks: BackgroundTasks,
-    normal_file: Annotated[UploadFile, File(description="Source document (DOCX, PDF, or PPTX)")],
-    target_file: Annotated[UploadFile, File(description="Template document with {{PLACEHOLDERS}} (DOCX or PPTX)")],
-    output_format: Annotated[Literal["docx", "pdf"], Form(description="Output format: 'docx' for Word document, 'pdf' for PDF")] = "docx",
-):
+def format_job_error(error: Exception) -> str:
+    """Map a pipeline exception to a user-facing error message."""
+    if isinstance(error, PDFConversionError):
+        return f"PDF conversion failed: {error.message}"
+    if isinstance(error, AIMapperError):
+        return f"AI mapping failed: {error.message}"
+    if isinstance(error, RenderingError):
+        return f"Rendering failed: {error.message}"
+    if isinstance(error, BaseAppException):
+        return str(error.message)
+    return f"Unexpected error: {str(error)}"
+
+
+async def run_pipeline(job_id: str, payload: dict[str, Any]) -> str:
     """
-    Process documents by extracting content from normal_file and
-    replacing placeholders in target_file.
-    
-    The target_file acts as a template and MUST contain placeholders
-    in the format {{KEY_NAME}}.
+    Run the full document pipeline for a queued job.
     
-    Returns a download URL for the processed document.
+    Args:
+        job_id: Job identifier (also the temp subdirectory name)
+        payload: Saved upload paths and request options
+        
+    Returns:
+        Download URL for the processed document
     """
-    job_id = str(uuid.uuid4())
+    job_dir: Path = payload["job_dir"]
+    source_path: Path = payload["source_path"]
+    template_path: Path = payload["template_path"]
+    template_stem: str = payload["template_stem"]
+    output_format: str = payload["output_format"]
     
     try:
-        # Validate files
-        validate_file(normal_file, "normal_file")
-        validate_file(target_file, "target_file")
-        
-        # Save uploaded files
-        source_path = await save_upload(normal_file, job_id, "source")
-        template_path = await save_upload(target_file, job_id, "template")
-        
-        # Step 1: Extract content from source document
-        extracted_content = extract_content(source_path)
+        # Step 1 + 2: Extract source content and analyze template sections
+        # (heading + body pairs) in parallel - they touch independent files
+        extracted_content, template_analysis = await asyncio.gather(
+            asyncio.to_thread(extract_content, source_path),
+            asyncio.to_thread(analyze_template, template_path),
+        )
         
         if not extracted_content.blocks:
-            raise HTTPException(
-                status_code=400,
-                detail="No content could be extracted from the source document"
-            )
-        
-        # Step 2: Analyze template for sections (heading + body pairs)
-        template_analysis = analyze_template(template_path)
+            raise ParsingError("No content could be extracted from the source document")
         
         # Step 3: Map content to sections using AI
         content_mapping = await map_content_to_placeholders(
@@ -155,12 +235,13 @@ async def process_documents(
         )
         
         # Step 4: Render the final document with style-preserving injection
-        output_filename = f"output_{Path(target_file.filename).stem}{template_path.suffix}"
-        output_path = get_temp_dir() / job_id / output_filename
+        output_filename = f"output_{template_stem}{template_path.suffix}"
+        output_path = job_dir / output_filename
         
-        render_document(
-            template_path, 
-            output_path, 
+        await asyncio.to_thread(
+            render_document,
+            template_path,
+            output_path,
             content_mapping,
             template_analysis
         )
@@ -170,50 +251,123 @@ async def process_documents(
         
         if output_format == "pdf":
             logger.info("PDF output format requested, converting DOCX to PDF")
-            pdf_filename = f"output_{Path(target_file.filename).stem}.pdf"
-            pdf_path = get_temp_dir() / job_id / pdf_filename
+            pdf_filename = f"output_{template_stem}.pdf"
+            pdf_path = job_dir / pdf_filename
             
-            try:
+            # PDF conversion is the serializing step - cap concurrent conversions
+            async with _get_pdf_semaphore():
                 await convert_docx_to_pdf(output_path, pdf_path)
-                final_filename = pdf_filename
-                logger.info(f"PDF conversion successful: {pdf_filename}")
-            except Exception as e:
-                logger.error(f"PDF conversion failed: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"PDF conversion failed: {str(e)}"
-                )
+            final_filename = pdf_filename
+            logger.info(f"PDF conversion successful: {pdf_filename}")
+        
+        return f"/api/download/{job_id}/{final_filename}"
+    
+    except Exception:
+        cleanup_job(job_dir)
+        raise
+
+
+_pdf_semaphore: asyncio.Semaphore | None = None
+
+
+def _get_pdf_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent PDF conversions."""
+    global _pdf_semaphore
+    if _pdf_semaphore is None:
+        _pdf_semaphore = asyncio.Semaphore(get_settings().pdf_concurrency)
+    return _pdf_semaphore
+
+
+@router.post(
+    "/process",
+    response_model=ProcessResponse,
+    status_code=202,
+    responses={
+        400: {"model": ErrorResponse},
+        413: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+        503: {"model": ErrorResponse},
+    },
+    summary="Process and transform documents",
+    description="Upload a source document and a template. The job is queued and its progress can be polled via /status/{job_id}."
+)
+async def process_documents(
+    request: Request,
+    normal_file: Annotated[UploadFile, Depends(validated_normal_file)],
+    target_file: Annotated[UploadFile, Depends(validated_target_file)],
+    temp_dir: Annotated[Path, Depends(get_temp_dir)],
+    max_upload_bytes: Annotated[int, Depends(get_max_upload_bytes)],
+    output_format: Annotated[Literal["docx", "pdf"], Form(description="Output format: 'docx' for Word document, 'pdf' for PDF")] = "docx",
+):
+    """
+    Queue documents for processing: content from normal_file is mapped
+    into the template structure of target_file.
+    
+    Uploads are validated and saved before the request returns; the
+    pipeline itself runs on the job queue's worker pool.
+    
+    Returns the job ID and a status URL to poll.
+    """
+    job_id = str(uuid6.uuid7())
+    job_dir = temp_dir / job_id
+    
+    try:
+        job_queue: JobQueue | None = getattr(request.app.state, "job_queue", None)
+        if job_queue is None:
+            raise HTTPException(status_code=503, detail="Job queue is not running")
+        
+        # Save uploaded files concurrently
+        job_dir.mkdir(parents=True, exist_ok=True)
+        source_path, template_path = await asyncio.gather(
+            save_upload(normal_file, job_dir, "source", max_upload_bytes),
+            save_upload(target_file, job_dir, "template", max_upload_bytes),
+        )
+        
+        await job_queue.submit(job_id, {
+            "job_dir": job_dir,
+            "source_path": source_path,
+            "template_path": template_path,
+            "template_stem": Path(target_file.filename).stem,
+            "output_format": output_format,
+        })
         
         return ProcessResponse(
             success=True,
-            message="Document processed successfully",
-            download_url=f"/api/download/{job_id}/{final_filename}",
-            job_id=job_id
+            message="Document queued for processing",
+            job_id=job_id,
+            status_url=f"/api/status/{job_id}"
         )
         
-    except PlaceholderNotFoundError as e:
-        cleanup_job(job_id)
-        raise HTTPException(status_code=400, detail=str(e.message))
-    except UnsupportedFileTypeError as e:
-        cleanup_job(job_id)
-        raise HTTPException(status_code=400, detail=str(e.message))
-    except AIMapperError as e:
-        cleanup_job(job_id)
-        raise HTTPException(status_code=500, detail=f"AI mapping failed: {e.message}")
-    except RenderingError as e:
-        cleanup_job(job_id)
-        raise HTTPException(status_code=500, detail=f"Rendering failed: {e.message}")
+    except FileTooLargeError as e:
+        cleanup_job(job_dir)
+        raise HTTPException(status_code=413, detail=str(e.message))
     except BaseAppException as e:
-        cleanup_job(job_id)
+        cleanup_job(job_dir)
         raise HTTPException(status_code=500, detail=str(e.message))
     except HTTPException:
-        cleanup_job(job_id)
+        cleanup_job(job_dir)
         raise
     except Exception as e:
-        cleanup_job(job_id)
+        cleanup_job(job_dir)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
+@router.get(
+    "/status/{job_id}",
+    response_model=JobStatus,
+    responses={404: {"model": ErrorResponse}},
+    summary="Get job status",
+    description="Poll the status of a queued processing job."
+)
+async def get_job_status(job_id: str, request: Request):
+    """Return the status of a processing job."""
+    job_queue: JobQueue | None = getattr(request.app.state, "job_queue", None)
+    status = job_queue.get(job_id) if job_queue else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return status
+
+
 @router.get(
     "/download/{job_id}/{filename}",
     summary="Download processed document",
@@ -222,31 +376,51 @@ async def process_documents(
 async def download_document(
     job_id: str,
     filename: str,
-    background_tasks: BackgroundTasks
+    request: Request,
+    background_tasks: BackgroundTasks,
+    temp_dir: Annotated[Path, Depends(get_temp_dir)]
 ):
     """Download a processed document."""
-    temp_dir = get_temp_dir()
-    file_path = temp_dir / job_id / filename
+    job_dir = temp_dir / job_id
+    file_path = job_dir / filename
     
-    if not file_path.exists():
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
         raise HTTPException(status_code=404, detail="File not found or expired")
     
-    # Schedule cleanup after download
-    background_tasks.add_task(cleanup_job, job_id)
+    # Hard-link the output outside the job directory so the job can be
+    # cleaned up right away; the link keeps the file alive for the transfer
+    # and is swept once the response has been sent.
+    # UUIDv7-named, so the sweeper's TTL pass removes links whose cleanup
+    # never ran (e.g. the client disconnected mid-transfer)
+    download_dir = temp_dir / DOWNLOADS_DIRNAME / str(uuid6.uuid7())
+    serve_path = download_dir / filename
+    try:
+        download_dir.mkdir(parents=True)
+        os.link(file_path, serve_path)
+    except OSError as e:
+        logger.warning(f"Could not link {file_path} for download, cleaning up afterwards: {e}")
+        schedule_removal(download_dir)
+        serve_path = file_path
+        background_tasks.add_task(cleanup_job, job_dir)
+    else:
+        cleanup_job(job_dir)
+        background_tasks.add_task(schedule_removal, download_dir)
+    
+    job_queue: JobQueue | None = getattr(request.app.state, "job_queue", None)
+    if job_queue:
+        job_queue.forget(job_id)
     
-    # Determine media type
-    ext = file_path.suffix.lower()
-    media_types = {
-        ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
-        ".pdf": "application/pdf",
-    }
-    media_type = media_types.get(ext, "application/octet-stream")
+    ext = filename.rpartition(".")[2].lower()
+    media_type = MEDIA_TYPES.get(ext, "application/octet-stream")
     
+    # Passing stat_result skips FileResponse's own stat() of the file
     return FileResponse(
-        path=str(file_path),
+        path=serve_path,
         filename=filename,
-        media_type=media_type
+        media_type=media_type,
+        stat_result=stat_result
     )
 
 
@@ -2,6 +2,7 @@
 Application configuration using pydantic-settings.
 """
 from functools import lru_cache
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -18,20 +19,60 @@ class Settings(BaseSettings):
     app_name: str = "Optira Document Transformer"
     debug: bool = False
     
+    # CORS - frontend origins allowed to call the API
+    cors_allowed_origins: list[str] = ["http://localhost:8080", "http://localhost:5173"]
+    
     # Groq API
     groq_api_key: str = ""
     groq_model: str = "llama-3.3-70b-versatile"
+    groq_mapper_model: str = "llama-3.1-8b-instant"  # Section mapping is structural parsing; the fast tier suffices
+    groq_json_mode: bool = True  # Request response_format=json_object for mapping calls (disables streaming)
+    groq_service_tier: str = ""  # e.g. "auto", "on_demand", "flex", "performance" (empty uses the account default)
     groq_timeout: int = 60
+    groq_max_connections: int = 50  # HTTP connection pool size for the shared client
+    groq_max_keepalive_connections: int = 20
+    groq_keepalive_expiry: float = 30.0  # Seconds an idle connection stays open
+    groq_retry_base_delay: float = 0.5  # Backoff before the first retry; doubles per attempt (plus jitter)
+    groq_retry_max_delay: float = 10.0  # Cap on any single backoff, including Retry-After
+    groq_hedge_after_ms: int = 0  # Send a duplicate request after this long (0 disables)
+    groq_max_concurrent_chunks: int = 4  # Chunks of one document mapped in parallel
+    groq_chunk_token_budget: int = 4000  # Estimated input tokens per chunk (0 splits on block count only)
+    groq_marshal_size: int = 1  # Chunks sent together in one request (1 disables marshaling)
+    groq_breaker_threshold: int = 5  # Consecutive transient Groq failures before calls are short-circuited
+    groq_breaker_reset_seconds: float = 30.0  # How long the circuit stays open
+    groq_max_output_tokens: int = 32768  # Upper bound on max_tokens; the actual budget scales with chunk size
+    mapping_cache_size: int = 1024  # Cached AI mappings (0 disables the cache)
+    mapping_cache_ttl_seconds: int = 3600
+    chunk_cache_size: int = 4096  # Cached per-chunk AI responses (0 disables)
+    template_cache_size: int = 128  # Cached template analyses, keyed on file content (0 disables)
+    template_max_concurrency: int = 8  # Templates analyzed at once by analyze_templates
     
     # ConvertAPI
     convertapi_secret: str = ""
     
+    # Concurrency
+    # Job status lives in the serving process, so more than one worker
+    # needs sticky routing for /status polling
+    server_workers: int = 1
+    thread_pool_size: int = 40  # Worker threads for blocking parse/render steps
+    worker_concurrency: int = 4  # Job queue workers running the /process pipeline
+    pdf_concurrency: int = 2  # Max concurrent PDF conversions
+    pdf_extract_workers: int = 4  # Processes extracting long source PDFs (0 or 1 disables)
+    pdf_extract_parallel_min_pages: int = 16  # Shorter PDFs are extracted in-thread
+    
     # File handling
     max_file_size_mb: int = 50
     temp_dir: str = "temp_uploads"
+    job_ttl_minutes: int = 60  # Unclaimed job directories are removed after this
     
     # Supported file types
-    supported_extensions: list[str] = [".docx", ".pdf", ".pptx"]
+    supported_extensions: frozenset[str] = frozenset({".docx", ".pdf", ".pptx"})
+    
+    @field_validator("supported_extensions", mode="before")
+    @classmethod
+    def _normalize_extensions(cls, value):
+        """Store extensions lowercased in a frozenset for O(1) lookups."""
+        return frozenset(ext.strip().lower() for ext in value)
 
 
 @lru_cache
@@ -2,16 +2,27 @@
 Optira Document Transformer - FastAPI Application
 Main entry point for the backend API.
 """
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from pathlib import Path
 import shutil
 
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import get_settings
-from app.api.endpoints import router as api_router
+from app.api.endpoints import router as api_router, run_pipeline, format_job_error
+from app.services.job_queue import JobQueue
+from app.services.parser import preload_document_libraries, shutdown_pdf_pool
+from app.services.pdf_converter import close_convertapi_client
+from app.services.ai_mapper import (
+    warm_groq_client,
+    close_groq_client,
+)
+from app.services.temp_sweeper import start_sweeper, stop_sweeper
 
 # Configure logging
 logging.basicConfig(
@@ -30,8 +41,52 @@ async def lifespan(app: FastAPI):
     temp_dir = Path(settings.temp_dir)
     temp_dir.mkdir(parents=True, exist_ok=True)
     
+    # Startup: Resolve per-request settings once
+    app.state.temp_dir = temp_dir
+    app.state.supported_extensions = settings.supported_extensions
+    app.state.max_upload_bytes = settings.max_file_size_mb * 1024 * 1024
+    
+    # Startup: Size thread pools used for blocking document work.
+    # asyncio.to_thread uses the loop's default executor; Starlette's
+    # run_in_threadpool goes through anyio's limiter.
+    executor = ThreadPoolExecutor(
+        max_workers=settings.thread_pool_size,
+        thread_name_prefix="optira-worker",
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.thread_pool_size
+    
+    # Startup: Load document libraries off the request path
+    await asyncio.to_thread(preload_document_libraries)
+    
+    # Startup: Create the job queue and launch the temp directory sweeper,
+    # which leaves the directories of queued and running jobs alone
+    app.state.job_queue = JobQueue(
+        handler=run_pipeline,
+        concurrency=settings.worker_concurrency,
+        error_formatter=format_job_error,
+        ttl_seconds=settings.job_ttl_minutes * 60,
+    )
+    await start_sweeper(
+        temp_dir,
+        ttl_seconds=settings.job_ttl_minutes * 60,
+        is_active=app.state.job_queue.is_active
+    )
+    
+    # Startup: Warm the Groq client and launch the job queue worker pool
+    await warm_groq_client()
+    await app.state.job_queue.start()
+    
     yield
     
+    # Shutdown: Stop workers and thread pool
+    await app.state.job_queue.stop()
+    await close_groq_client()
+    await close_convertapi_client()
+    await stop_sweeper()
+    await asyncio.to_thread(shutdown_pdf_pool)
+    executor.shutdown(wait=False)
+    
     # Shutdown: Clean up temp directory
     if temp_dir.exists():
         shutil.rmtree(temp_dir, ignore_errors=True)
@@ -53,10 +108,11 @@ def create_app() -> FastAPI:
     # CORS middleware
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=["*"],  # Configure appropriately for production
+        allow_origins=settings.cors_allowed_origins,
         allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+        allow_methods=["GET", "POST"],
+        allow_headers=["content-type", "authorization"],
+        max_age=86400,  # Let browsers cache preflight responses for a day
     )
     
     # Include API router
@@ -71,4 +127,17 @@ app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    
+    settings = get_settings()
+    if settings.debug:
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # "auto" picks uvloop and httptools when installed (not on Windows)
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=settings.server_workers,
+            loop="auto",
+            http="auto",
+        )
@@ -2,316 +2,312 @@
 AI Mapper using Groq LLM for semantic section mapping.
 Maps source content blocks to template sections based on meaning.
 """
-import json
+import asyncio
 import logging
-from typing import Any
+import random
+from itertools import islice
+from operator import attrgetter
+from typing import Any, NamedTuple
 
-from groq import Groq
-from pydantic import BaseModel, ValidationError
+import httpx
+import orjson
+from groq import APIStatusError, APITimeoutError, AsyncGroq
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 from app.core.config import get_settings
 from app.core.exceptions import AIMapperError, AIResponseValidationError, GroqAPIError
-from app.services.parser import ExtractedContent, content_to_text_summary
-from app.services.analyzer import TemplateAnalysis
+from app.services.parser import ExtractedContent, blocks_to_text_summary
+from app.services.analyzer import TemplateAnalysis, get_section_descriptions
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.mapping_cache import MappingCache, chunk_cache_key, mapping_cache_key
+from app.services.json_stream import ArrayStreamParser
 
 logger = logging.getLogger(__name__)
 
+# Block text accessor for the fallback paths (C-level attribute lookup)
+_get_content = attrgetter("content")
 
-class SectionMapping(BaseModel):
-    """Validated mapping of section IDs to content."""
-    mappings: dict[str, Any]
 
-
-def create_section_mapping_prompt(
-    content: ExtractedContent,
-    analysis: TemplateAnalysis
-) -> str:
+class SectionMapping(BaseModel):
     """
-    Create prompt for AI to convert flat or semi-structured source content
-    into deterministic, template-ready sections.
+    Mapping of section IDs to content.
+    
+    Mappings are built internally from already-parsed JSON, so the mapper
+    creates instances with model_construct() and skips validation.
     """
+    mappings: dict[str, Any]
 
-    content_text = content_to_text_summary(content)
-
-    prompt = f"""
-You are a document structure parser, NOT a writer.
-
-Your task is to convert raw source content into a clean, structured JSON format
-that can be injected into a predefined company document template.
-
-You must preserve meaning exactly. Do NOT summarize, rewrite, or embellish.
-
----
-
-## PRIMARY OBJECTIVE
-Convert the source content into an ordered list of Sections.
-Each Section MUST have:
-- a "title"
-- a "body" array of structured content blocks
-
-This output will be mapped directly into a document template.
-Accuracy and stability are more important than creativity.
-
----
-
-## SOURCE CONTENT CHARACTERISTICS
-The source text may be:
-- completely flat
-- poorly formatted
-- missing headings
-- a wall of text
-- loosely structured prose
-
-You MUST infer structure carefully, conservatively, and consistently.
-
----
-
-## SECTION INFERENCE RULES (VERY IMPORTANT)
-
-### 0. Document Title Detection (FIRST PRIORITY – BEFORE Section Inference)
-
-If the FIRST non-empty line appears to be a meaningful document title, you MUST use it as the first section title.
-
-Treat the first line as a title only when:
-- it is short (typically < 12–15 words)
-- it is standalone
-- it is not a paragraph
-- it clearly represents the whole document
-
----
-
-### 0.1 Title Consumption (MANDATORY)
-
-When a title is detected:
-
-- Remove it completely from the content before parsing begins
-- Do NOT include it again inside any section body
-- Do NOT convert it into text/subheading/bullet
-- It must appear ONLY once as the section title
-
-Parsing MUST start strictly AFTER the title line.
-
----
-
-### 0.2 Sequential Parsing (MANDATORY – DO NOT REORDER) ⚠️ CRITICAL
-
-Process the document STRICTLY from top to bottom.
-This is the MOST IMPORTANT rule. Violating this rule is a CRITICAL FAILURE.
-
-ABSOLUTELY NEVER:
-- regroup content by topic
-- reorganize by semantic meaning
-- move paragraphs to different positions
-- place middle content at the end
-- place end content in the middle
-- merge text from distant parts of the document
-- "optimize" the order in any way
-- "improve" the structure
-
-If line A appears before line B in the source,
-line A MUST appear before line B in output.
-
-If paragraph X is in the middle of the source,
-paragraph X MUST be in the middle of the output.
-
-EXAMPLE:
-Source order: Name → Contact → Summary → Experience → Education
-Output order: Name → Contact → Summary → Experience → Education
-
-WRONG output: Name → Summary → Experience → Education → Contact (shuffled!)
-
-Order preservation is ABSOLUTE and NON-NEGOTIABLE.
-
----
-
-### 0.3 Title Validation (ANTI-GENERIC SAFETY)
-
-Generic labels are NOT valid titles.
-
-Words like:
-- Document
-- Resume
-- CV
-- File
-- Report
-- Page
-- Template
-- Draft
-- Notes
-- Form
-- Data
-
-are NOT meaningful titles IF they appear standalone.
-
-If the first non-empty line is EXACTLY one of these words, you MUST ignore it and look for the next line.
-If it is part of a longer meaningful title (e.g. "Project Report 2024" or "Software Engineer Resume"), it is a VALID title and you should use it.
-
----
-
-### 0.4 Line-by-Line Streaming Parse (STRICT)
-
-Parse incrementally:
-
-- read one line
-- assign immediately
-- move to next line
-
-NEVER analyze the whole document first.
-NEVER batch or restructure.
-
-This guarantees zero shuffling.
-
----
-
-### 0.5 Title Hard Rejection (STRICT – MUST NOT USE GENERIC WORDS)
 
-If the first line equals or mostly consists of generic placeholders such as:
+class MappedBlock(BaseModel):
+    """One body item of an AI-mapped section."""
+    type: str = "text"
+    content: str
 
-Document, Resume, CV, File, Report, Page, Template, Draft, Form, Data
 
-You MUST:
+class MappedSection(BaseModel):
+    """One section of the AI response (body may be a plain string)."""
+    title: str = ""
+    body: list[MappedBlock] | str = []
 
-1. Skip the line completely
-2. NOT use it as a title
-3. NOT output it anywhere
-4. Continue scanning for the next meaningful line
 
-These words are metadata only.
+# Schema check for a chunk's sections; the validated models are discarded
+# and the parsed dicts are kept, so this costs one pass with no copies
+_SECTIONS_ADAPTER = TypeAdapter(list[MappedSection])
 
-Under NO circumstances may they be used as section titles.
 
-If a person's name or meaningful heading appears next, use THAT.
-A title is rejected ONLY if it is a single standalone generic word.
+async def _hedged_completion(client: AsyncGroq, **request_kwargs) -> Any:
+    """
+    Send a completion request, firing a duplicate (hedge) request if the first
+    is still outstanding after groq_hedge_after_ms. The first successful
+    response wins and the other request is cancelled.
+    
+    Hedging is disabled when groq_hedge_after_ms is 0.
+    """
+    hedge_after_ms = get_settings().groq_hedge_after_ms
+    primary = asyncio.create_task(_stream_completion(client, **request_kwargs))
+    tasks = {primary}
+    # Whatever happens, including the caller being cancelled, no request is
+    # left running (and streaming billed tokens) after this returns
+    try:
+        if hedge_after_ms <= 0:
+            return await primary
+        
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after_ms / 1000)
+        if done:
+            return primary.result()
+        
+        logger.info(f"  Groq request outstanding > {hedge_after_ms}ms, sending hedge request")
+        tasks.add(asyncio.create_task(_stream_completion(client, **request_kwargs)))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# Exact-match cache of completed mappings (shared across requests)
+_mapping_cache = MappingCache(
+    maxsize=get_settings().mapping_cache_size,
+    ttl_seconds=get_settings().mapping_cache_ttl_seconds
+)
+
+
+# Per-chunk responses, keyed on the exact request - when a document is
+# edited, only the chunks whose text changed go back to Groq
+_chunk_cache = MappingCache(
+    maxsize=get_settings().chunk_cache_size,
+    ttl_seconds=get_settings().mapping_cache_ttl_seconds
+)
+
+
+# Trips after repeated Groq outages so chunks fall back immediately instead
+# of each waiting out timeouts and retries
+_groq_breaker = CircuitBreaker(
+    "Groq",
+    failure_threshold=get_settings().groq_breaker_threshold,
+    reset_seconds=get_settings().groq_breaker_reset_seconds
+)
+
+
+# Shared async Groq client - reuses its keep-alive connection pool across requests
+_client: AsyncGroq | None = None
+_client_lock = asyncio.Lock()
+
+
+async def get_groq_client() -> AsyncGroq:
+    """Get the shared AsyncGroq client, creating it on first use."""
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                settings = get_settings()
+                # Explicit pool so keep-alive connections outlive bursts of jobs
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=settings.groq_max_connections,
+                        max_keepalive_connections=settings.groq_max_keepalive_connections,
+                        keepalive_expiry=settings.groq_keepalive_expiry
+                    ),
+                    timeout=settings.groq_timeout
+                )
+                # Retries are handled by the mapper's backoff loop, not the SDK
+                _client = AsyncGroq(
+                    api_key=settings.groq_api_key,
+                    http_client=http_client,
+                    max_retries=0
+                )
+    return _client
 
----
 
-### 0.6 Resume/CV Special Handling (CRITICAL FOR RESUMES)
+async def warm_groq_client() -> None:
+    """
+    Open the shared client's connection pool at startup (DNS + TLS) with a
+    cheap models.list() call, so the first mapping request doesn't pay for it.
+    Failures are logged and ignored.
+    """
+    settings = get_settings()
+    if not settings.groq_api_key:
+        return
+    
+    try:
+        client = await get_groq_client()
+        await client.with_options(timeout=2.0, max_retries=0).models.list()
+        logger.info("Groq client warmed up")
+    except Exception as e:
+        logger.warning(f"Groq client warm-up failed: {e}")
 
-For RESUME or CV documents:
-- The FIRST SECTION TITLE should be the PERSON'S FULL NAME (not "Resume", "CV", or "Document")
-- Look for a name-like pattern: typically 2-4 capitalized words at or near the beginning
-- Examples of VALID first section titles for resumes:
-  - "John Smith"
-  - "Sarah Jane Johnson"
-  - "Gopal Murthy"
-  
-If the document appears to be a resume (contains keywords like: experience, education, skills, qualifications, employment history):
-- FIND the person's name and use it as the first section title
-- Skip any generic labels that appear before the name
 
----
+async def close_groq_client() -> None:
+    """Close the shared AsyncGroq client."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
-### 1. Section Titles
-Infer a section title ONLY when there is strong evidence:
-- a short standalone line
-- a clear topic shift
-- a repeated thematic phrase
-- a commonly expected document section (e.g. Introduction, Overview, Conclusion)
 
-If unsure, prefer SAFE, GENERIC titles such as:
-- "Introduction"
-- "Overview"
-- "Details"
-- "Additional Information"
+class StreamedCompletion(NamedTuple):
+    """Full response text plus sections decoded while the response streamed."""
+    text: str
+    sections: list[dict] | None  # None if the stream wasn't a clean JSON array
 
-DO NOT invent overly specific or creative titles.
 
----
+async def _stream_completion(client: AsyncGroq, **request_kwargs) -> StreamedCompletion:
+    """
+    Stream a chat completion, decoding each section object as soon as it
+    closes so parsing overlaps with generation.
+    
+    Groq doesn't document streaming together with JSON mode, so requests
+    with a response_format are sent unstreamed and parsed in full.
+    """
+    if "response_format" in request_kwargs:
+        response = await client.chat.completions.create(**request_kwargs)
+        return StreamedCompletion(text=response.choices[0].message.content or "", sections=None)
+    
+    stream = await client.chat.completions.create(stream=True, **request_kwargs)
+    parser = ArrayStreamParser()
+    fragments: list[str] = []
+    
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                fragments.append(delta)
+                parser.feed(delta)
+    finally:
+        # Release the HTTP stream even when cancelled (e.g. a losing hedge),
+        # so the server stops generating tokens for it
+        await stream.close()
+    
+    return StreamedCompletion(
+        text="".join(fragments),  # orjson tolerates surrounding whitespace
+        sections=parser.items if parser.complete else None
+    )
 
-### 2. Body Content Types
-Each body item MUST be one of the following types:
 
-- "text"  
-  → Standard paragraph content.
+# Compact schema of the required output, serialized once at import time
+OUTPUT_SCHEMA = orjson.dumps(
+    {"sections": [{"title": "str", "body": [{"type": "text|subheading|bullet", "content": "str"}]}]}
+).decode()
 
-- "subheading"  
-  → Minor internal headings inside a section.
 
-- "bullet"  
-  → List items.
+# Static rulebook and output schema, sent as the system message. It is
+# byte-identical on every call so Groq can reuse its cached prefix; only the
+# source content in the user message varies. Kept terse: input tokens drive
+# time-to-first-token.
+SECTION_MAPPING_SYSTEM_PROMPT = f"""
+You are a document structure parser, not a writer. Split the source content into ordered sections for a document template.
 
----
+Rules:
+1. Copy text verbatim, character by character. Never summarize, rephrase, shorten, repeat or add content.
+2. Keep source order exactly, top to bottom. Never regroup, move or merge content.
+3. If the first non-empty line is a short standalone document title, make it the first section title and omit it from every body.
+4. Skip a first line that is only a generic word (Document, Resume, CV, File, Report, Page, Template, Draft, Notes, Form, Data); "Project Report 2024" is a valid title.
+5. For a resume/CV, the first section title is the person's full name.
+6. Start a new section only at a clear heading or topic shift; if unsure use a plain title such as "Introduction", "Overview" or "Details".
+7. Body types: "text" (paragraph), "subheading" (minor heading in the source), "bullet" (list item). Default to "text"; never invent subheadings.
+8. Split paragraphs only when necessary, never mid-sentence.
 
-### 3. Paragraph Splitting
-- Break long paragraphs only when necessary
-- Do NOT fragment sentences
-- Maintain order strictly
+Output only a JSON object matching: {OUTPUT_SCHEMA}
+""".strip()
 
----
+_PROMPT_PREFIX = "## SOURCE CONTENT\n"
 
-## STRICT RULES (NON-NEGOTIABLE)
-1. **VERBATIM CONTENT**: Copy text EXACTLY as it appears in the source. Do NOT rephrase, paraphrase, or improve wording.
-2. Preserve ALL original meaning and wording CHARACTER BY CHARACTER.
-3. DO NOT summarize or shorten content.
-4. DO NOT add new facts, interpretations, or infer content that is not explicitly stated.
-5. DO NOT repeat content.
-6. Maintain EXACT original order.
-7. NEVER reorganize structure.
-8. If structure is ambiguous, default to "text" type. Do NOT invent subheadings that aren't in the source.
-9. Output MUST be valid JSON.
-10. Output MUST match the required schema exactly.
+_PROMPT_SUFFIX = "\n\nReturn only the JSON object, with sections in source order."
 
----
+# Second system message when several chunks are marshaled into one request;
+# the main system prompt stays first so the cached prefix is still shared
+_MARSHAL_SYSTEM_PROMPT = (
+    "The user message holds several numbered source chunks. Apply the rules above to each chunk "
+    'independently and return {"chunks": [<sections of chunk 1>, <sections of chunk 2>, ...]} '
+    "with exactly one sections array per chunk, in chunk order."
+)
 
-## SOURCE CONTENT
-{content_text}
 
----
+def create_section_mapping_prompt(content_text: str) -> str:
+    """
+    Create the user message for converting flat or semi-structured source
+    content (as formatted by blocks_to_text_summary) into deterministic,
+    template-ready sections. The rules live in SECTION_MAPPING_SYSTEM_PROMPT.
+    """
+    return _PROMPT_PREFIX + content_text + _PROMPT_SUFFIX
 
-## REQUIRED OUTPUT FORMAT (JSON ONLY)
 
-[
-  {{
-    "title": "Section Title",
-    "body": [
-      {{
-        "type": "text",
-        "content": "Paragraph text exactly as derived from source."
-      }},
-      {{
-        "type": "subheading",
-        "content": "Sub-section title"
-      }},
-      {{
-        "type": "bullet",
-        "content": "Bullet item text"
-      }}
+def _build_multichunk_prompt(chunk_texts: list[str]) -> str:
+    """Create the user message for several chunks mapped in one request."""
+    parts = [
+        f"## SOURCE CHUNK {idx}\n{text}\n## END CHUNK {idx}"
+        for idx, text in enumerate(chunk_texts, start=1)
     ]
-  }}
-]
-
-⚠️ FINAL REMINDER: The output MUST follow the EXACT SAME ORDER as the source content.
-Do NOT shuffle, reorganize, or reorder any content. First item in source = first item in output.
-
-Return ONLY the JSON array. No explanations. No markdown. No extra text.
-"""
-    return prompt
-
-
+    return "\n\n".join(parts) + '\n\nReturn only the {"chunks": [...]} JSON object.'
 
 
-
-
-def _chunk_content_blocks(blocks: list, chunk_size: int = 25) -> list[list]:
+def _chunk_content_blocks(blocks: list, chunk_size: int = 25, token_budget: int = 0) -> list[list]:
     """
     Split content blocks into chunks for processing long documents.
     
+    Blocks are packed greedily: a chunk closes when it reaches chunk_size
+    blocks or when the next block would push its estimated input tokens
+    past token_budget, so a run of long paragraphs can't overflow the
+    context window while short bullets still share a call.
+    
     Args:
         blocks: List of ContentBlock objects
         chunk_size: Maximum number of blocks per chunk
+        token_budget: Maximum estimated tokens per chunk (0 disables)
         
     Returns:
         List of chunk lists
     """
-    if len(blocks) <= chunk_size:
-        return [blocks]
+    if not token_budget:
+        if len(blocks) <= chunk_size:
+            return [blocks]
+        chunks = [blocks[i:i + chunk_size] for i in range(0, len(blocks), chunk_size)]
+    else:
+        chunks = []
+        current: list = []
+        current_tokens = 0
+        for block in blocks:
+            tokens = _estimate_tokens(block.content)
+            if current and (len(current) >= chunk_size or current_tokens + tokens > token_budget):
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(block)
+            current_tokens += tokens
+        if current or not chunks:
+            chunks.append(current)
     
-    chunks = []
-    for i in range(0, len(blocks), chunk_size):
-        chunk = blocks[i:i + chunk_size]
-        chunks.append(chunk)
-    
-    logger.info(f"Split {len(blocks)} blocks into {len(chunks)} chunks of ~{chunk_size} blocks each")
+    if len(chunks) > 1:
+        logger.info(f"Split {len(blocks)} blocks into {len(chunks)} chunks (max {chunk_size} blocks, {token_budget or 'no'} token budget)")
     return chunks
 
 
@@ -319,9 +315,9 @@ def _merge_section_mappings(all_sections: list[list[dict]]) -> list[dict]:
     """
     Merge section mappings from multiple chunks.
     
-    Strategy: 
-    1. First, merge adjacent sections across chunk boundaries
-    2. Then, deduplicate sections with the same title globally
+    Strategy: a single pass over all chunks in order. Sections sharing a
+    (case-insensitive) title are merged into the first occurrence, which
+    also joins a section split across a chunk boundary.
     
     Args:
         all_sections: List of section lists from each chunk
@@ -335,83 +331,41 @@ def _merge_section_mappings(all_sections: list[list[dict]]) -> list[dict]:
     if len(all_sections) == 1:
         return all_sections[0]
     
-    # Step 1: Merge adjacent sections across chunk boundaries
-    merged = []
-    
-    for i, chunk_sections in enumerate(all_sections):
-        if not chunk_sections:
-            continue
-            
-        if i == 0:
-            # First chunk: add all sections
-            merged.extend(chunk_sections)
-        else:
-            # Check if we need to merge with the last section from previous chunk
-            if merged and chunk_sections:
-                last_section = merged[-1]
-                first_section = chunk_sections[0]
-                
-                # Normalize titles for comparison (lowercase, strip)
-                last_title = last_section.get("title", "").lower().strip()
-                first_title = first_section.get("title", "").lower().strip()
-                
-                if last_title and first_title and last_title == first_title:
-                    # Merge bodies
-                    logger.info(f"  Merging section across chunks: '{last_section.get('title', '')}'")
-                    last_body = last_section.get("body", [])
-                    first_body = first_section.get("body", [])
-                    
-                    if isinstance(last_body, str):
-                        last_body = [{"type": "text", "content": last_body}]
-                    if isinstance(first_body, str):
-                        first_body = [{"type": "text", "content": first_body}]
-                    
-                    # Merge bodies
-                    merged[-1]["body"] = last_body + first_body
-                    
-                    # Add remaining sections from this chunk (skip first since we merged it)
-                    merged.extend(chunk_sections[1:])
-                else:
-                    # No merge needed, just append all sections
-                    merged.extend(chunk_sections)
-            else:
-                # No previous sections, just append
-                merged.extend(chunk_sections)
-    
-    logger.info(f"Merged {len(all_sections)} chunks into {len(merged)} sections")
-    
-    # Step 2: Global deduplication - merge all sections with the same title
     deduplicated = []
-    seen_titles = {}  # Map of normalized title -> index in deduplicated list
+    seen_titles: dict[str, dict] = {}  # Normalized title -> section in deduplicated
+    owned_bodies: set[str] = set()  # Titles whose body list was created here
+    total = 0
     
-    for section in merged:
-        title = section.get("title", "")
-        normalized_title = title.lower().strip()
-        
-        if normalized_title in seen_titles:
-            # Merge with existing section
-            existing_idx = seen_titles[normalized_title]
-            logger.info(f"  Deduplicating section: '{title}' (merging into previous occurrence)")
+    for chunk_sections in all_sections:
+        for section in chunk_sections:
+            total += 1
+            title = section.get("title", "")
+            normalized_title = title.lower().strip()
+            existing = seen_titles.get(normalized_title)
             
-            existing_body = deduplicated[existing_idx].get("body", [])
-            new_body = section.get("body", [])
+            if existing is None:
+                # First occurrence of this title
+                seen_titles[normalized_title] = section
+                deduplicated.append(section)
+                continue
             
-            if isinstance(existing_body, str):
-                existing_body = [{"type": "text", "content": existing_body}]
-            if isinstance(new_body, str):
-                new_body = [{"type": "text", "content": new_body}]
-            
-            # Merge bodies
-            deduplicated[existing_idx]["body"] = existing_body + new_body
-        else:
-            # First occurrence of this title
-            seen_titles[normalized_title] = len(deduplicated)
-            deduplicated.append(section)
-    
-    logger.info(f"After deduplication: {len(deduplicated)} unique sections")
+            logger.info(f"  Merging section: '{title}' (into previous occurrence)")
+            if normalized_title not in owned_bodies:
+                # Copy once, then extend in place - no repeated list concatenation
+                existing["body"] = _body_items(existing.get("body", []))
+                owned_bodies.add(normalized_title)
+            existing["body"].extend(_body_items(section.get("body", [])))
+    
+    logger.info(f"Merged {len(all_sections)} chunks ({total} sections) into {len(deduplicated)} unique sections")
     return deduplicated
 
 
+def _body_items(body: list | str) -> list:
+    """A section body as a new list of items (a plain string becomes one text item)."""
+    if isinstance(body, str):
+        return [{"type": "text", "content": body}]
+    return list(body)
+
 
 async def map_content_to_sections(
     content: ExtractedContent,
@@ -435,92 +389,126 @@ async def map_content_to_sections(
         logger.error("No sections found in template!")
         raise AIMapperError("No sections found in template")
     
-    client = Groq(api_key=settings.groq_api_key)
+    # Summarize each chunk once; the joined summaries are the whole-document
+    # text used for the cache key, and each one becomes a chunk prompt
+    chunks = _chunk_content_blocks(content.blocks, chunk_size, settings.groq_chunk_token_budget)
+    chunk_texts = [blocks_to_text_summary(chunk_blocks) for chunk_blocks in chunks]
     
-    # Split content into chunks if needed
-    chunks = _chunk_content_blocks(content.blocks, chunk_size)
-    all_sections = []
+    # Identical content + template + model give the same mapping - skip the
+    # API on a hit and share one call between concurrent identical requests
+    cache_key = mapping_cache_key(
+        "\n\n".join(chunk_texts),
+        get_section_descriptions(analysis),
+        settings.groq_mapper_model,
+        chunk_size,
+        settings.groq_chunk_token_budget
+    )
     
-    # Process each chunk
-    for chunk_idx, chunk_blocks in enumerate(chunks):
-        logger.info(f"Processing chunk {chunk_idx + 1}/{len(chunks)} ({len(chunk_blocks)} blocks)")
-        
-        # Create a temporary ExtractedContent for this chunk
-        chunk_content = ExtractedContent(blocks=chunk_blocks, source_file=content.source_file)
-        prompt = create_section_mapping_prompt(chunk_content, analysis)
-        
-        logger.debug(f"Chunk {chunk_idx + 1} prompt preview: {prompt[:300]}...")
-        
-        last_error: Exception | None = None
-        chunk_sections = None
+    async def compute() -> tuple[dict[str, Any], bool]:
+        return await _map_chunks(chunks, chunk_texts, max_retries)
+    
+    mappings = await _mapping_cache.get_or_compute(cache_key, compute)
+    return SectionMapping.model_construct(mappings=mappings)
+
+
+async def map_content_to_sections_batch(
+    items: list[tuple[ExtractedContent, TemplateAnalysis]],
+    max_retries: int = 2,
+    chunk_size: int = 25
+) -> list[SectionMapping]:
+    """
+    Map several documents at once. Their Groq calls run in parallel over the
+    shared client; results keep the input order.
+    """
+    return await asyncio.gather(*(
+        map_content_to_sections(content, analysis, max_retries, chunk_size)
+        for content, analysis in items
+    ))
+
+
+async def _map_chunks(
+    chunks: list[list],
+    chunk_texts: list[str],
+    max_retries: int
+) -> tuple[dict[str, Any], bool]:
+    """
+    Map content chunks concurrently via Groq and merge the results in order.
+    
+    Args:
+        chunks: Content blocks per chunk (used for the fallback)
+        chunk_texts: Text summary of each chunk
+        max_retries: Retries per chunk before falling back
+    
+    Returns:
+        The {"sections": [...]} mapping, and whether it is safe to cache
+        (False if any chunk needed the fallback)
+    """
+    settings = get_settings()
+    prompts = [create_section_mapping_prompt(text) for text in chunk_texts]
+    
+    client = await get_groq_client()
+    request_options: dict[str, Any] = {}
+    if settings.groq_json_mode:
+        # JSON mode guarantees a bare JSON object - no markdown fences
+        request_options["response_format"] = {"type": "json_object"}
+    if settings.groq_service_tier:
+        request_options["service_tier"] = settings.groq_service_tier
+    
+    # Chunks are independent requests - fire them in parallel (bounded so one
+    # long document can't monopolize the connection pool) and merge in order
+    semaphore = asyncio.Semaphore(max(1, settings.groq_max_concurrent_chunks))
+    
+    if settings.groq_marshal_size > 1 and settings.chunk_cache_size > 0 and len(prompts) > 1:
+        # Marshaled results land in the chunk cache (so it must be enabled);
+        # chunks they miss are mapped one by one below
+        await _prefetch_marshaled_chunks(
+            client, prompts, chunk_texts, settings.groq_marshal_size, semaphore, request_options
+        )
+    
+    async def map_one(chunk_idx: int, blocks: list, prompt: str) -> list[dict] | None:
+        try:
+            async with semaphore:
+                logger.info(f"Processing chunk {chunk_idx + 1}/{len(chunks)} ({len(blocks)} blocks)")
+                return await _map_chunk(client, chunk_idx, prompt, max_retries, request_options)
+        except _ContextLengthExceeded:
+            if len(blocks) < 2:
+                logger.warning(f"  Chunk {chunk_idx + 1} exceeds the context window and can't be split")
+                return None
         
-        for attempt in range(max_retries + 1):
-            logger.info(f"  Chunk {chunk_idx + 1} attempt {attempt + 1}/{max_retries + 1}")
-            try:
-                response = client.chat.completions.create(
-                    model=settings.groq_model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a document parser that preserves EXACT order. Return only valid JSON array of sections with 'title' and 'body' fields. CRITICAL: Content order in output MUST match source order exactly. Never reorganize or shuffle content."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    temperature=0.0,  # Zero temperature for maximum determinism - no creativity
-                    max_tokens=32768,
-                    timeout=settings.groq_timeout
-                )
-                
-                response_text = response.choices[0].message.content.strip()
-                logger.info(f"  Chunk {chunk_idx + 1} AI response received ({len(response_text)} chars)")
-                logger.debug(f"  Chunk {chunk_idx + 1} AI response: {response_text[:500]}...")
-                
-                # Parse JSON response - expecting array
-                sections_array = _parse_ai_response(response_text)
-                
-                if isinstance(sections_array, list):
-                    chunk_sections = sections_array
-                    logger.info(f"  Chunk {chunk_idx + 1} parsed {len(sections_array)} sections")
-                    for i, sec in enumerate(sections_array):
-                        title = sec.get("title", "")
-                        body = sec.get("body", "")
-                        logger.info(f"    Section {i+1}: '{title[:40]}' ({len(body)} items)")
-                    break  # Success, exit retry loop
-                else:
-                    # Unexpected format
-                    logger.warning(f"  Chunk {chunk_idx + 1} returned unexpected format")
-                    chunk_sections = []
-                    break
-                    
-            except ValidationError as e:
-                logger.error(f"  Chunk {chunk_idx + 1} validation error: {e}")
-                last_error = AIResponseValidationError(
-                    f"AI response validation failed: {str(e)}",
-                    details=str(e)
-                )
-            except json.JSONDecodeError as e:
-                logger.error(f"  Chunk {chunk_idx + 1} JSON decode error: {e}")
-                last_error = AIResponseValidationError(
-                    f"AI response is not valid JSON: {str(e)}",
-                    details=response_text if 'response_text' in locals() else None
-                )
-            except Exception as e:
-                logger.error(f"  Chunk {chunk_idx + 1} API error: {e}")
-                if "timeout" in str(e).lower():
-                    last_error = GroqAPIError(f"Groq API timeout: {str(e)}")
-                else:
-                    last_error = GroqAPIError(f"Groq API error: {str(e)}")
+        # Too long for the model - map each half separately and rejoin them
+        half = len(blocks) // 2
+        logger.warning(f"  Chunk {chunk_idx + 1} exceeds the context window, splitting {len(blocks)} blocks in half")
+        halves = await asyncio.gather(*(
+            map_one(chunk_idx, part, create_section_mapping_prompt(blocks_to_text_summary(part)))
+            for part in (blocks[:half], blocks[half:])
+        ))
+        if any(sections is None for sections in halves):
+            return None
+        return _merge_section_mappings(list(halves))
+    
+    # An unexpected error in one chunk must not discard its siblings' results
+    results = await asyncio.gather(
+        *(map_one(idx, chunks[idx], prompt) for idx, prompt in enumerate(prompts)),
+        return_exceptions=True
+    )
+    
+    all_sections = []
+    used_fallback = False
+    for chunk_idx, (chunk_blocks, chunk_sections) in enumerate(zip(chunks, results)):
+        if isinstance(chunk_sections, asyncio.CancelledError):
+            raise chunk_sections
+        if isinstance(chunk_sections, Exception):
+            logger.error(f"  Chunk {chunk_idx + 1} raised unexpectedly: {chunk_sections}")
+            chunk_sections = None
         
         # If chunk processing failed after retries, use fallback
         if chunk_sections is None:
             logger.warning(f"  Chunk {chunk_idx + 1} failed, using fallback")
+            used_fallback = True
             # Create a simple fallback - treat all blocks as a single section
             chunk_sections = [{
                 "title": f"Section {chunk_idx + 1}",
-                "body": [{"type": "text", "content": block.content} for block in chunk_blocks]
+                "body": [{"type": "text", "content": text} for text in map(_get_content, chunk_blocks)]
             }]
         
         all_sections.append(chunk_sections)
@@ -532,17 +520,292 @@ async def map_content_to_sections(
     mapping_dict = {"sections": merged_sections}
     logger.info(f"Final result: {len(merged_sections)} sections total")
     
-    return SectionMapping(mappings=mapping_dict)
+    # Don't cache degraded results - a later retry may succeed
+    return mapping_dict, not used_fallback
 
 
-def _parse_ai_response(response_text: str) -> Any:
-    """Parse AI response, handling markdown code blocks."""
-    text = response_text.strip()
-    if text.startswith("```"):
-        lines = text.split("\n")
-        text = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
+async def _map_chunk(
+    client: AsyncGroq,
+    chunk_idx: int,
+    prompt: str,
+    max_retries: int,
+    request_options: dict[str, Any]
+) -> list[dict] | None:
+    """
+    Map one chunk, retrying transient failures.
+    
+    Returns:
+        The chunk's sections, or None if every attempt failed
+    """
+    settings = get_settings()
+    logger.debug(f"Chunk {chunk_idx + 1} prompt preview: {prompt[:300]}...")
+    
+    # temperature=0, so an identical request can reuse the earlier response
+    cache_key = _chunk_key(prompt)
+    cached = _chunk_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"  Chunk {chunk_idx + 1} served from cache")
+        return cached["sections"]
+    
+    max_tokens = _output_token_budget(prompt, settings.groq_max_output_tokens)
+    
+    last_error: Exception | None = None
+    chunk_sections = None
+    messages = [
+        {
+            "role": "system",
+            "content": SECTION_MAPPING_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    
+    for attempt in range(max_retries + 1):
+        if not _groq_breaker.allow():
+            logger.warning(f"  Chunk {chunk_idx + 1} skipped: Groq circuit is open")
+            break
+        
+        logger.info(f"  Chunk {chunk_idx + 1} attempt {attempt + 1}/{max_retries + 1}")
+        try:
+            completion = await _hedged_completion(
+                client,
+                model=settings.groq_mapper_model,
+                messages=messages,
+                temperature=0.0,  # Zero temperature for maximum determinism - no creativity
+                max_tokens=max_tokens,
+                timeout=settings.groq_timeout,
+                **request_options
+            )
+            _groq_breaker.record_success()
+            
+            response_text = completion.text
+            logger.info(f"  Chunk {chunk_idx + 1} AI response received ({len(response_text)} chars)")
+            logger.debug(f"  Chunk {chunk_idx + 1} AI response: {response_text[:500]}...")
+            
+            # Use sections decoded during streaming; otherwise parse the full
+            # JSON response - expecting array
+            if completion.sections is not None:
+                sections_array = completion.sections
+            else:
+                sections_array = _parse_ai_response(response_text)
+            
+            # An empty or non-list result would drop this chunk's content, so
+            # it is retried (and never cached) like any other bad response
+            if not isinstance(sections_array, list) or not sections_array:
+                logger.warning(f"  Chunk {chunk_idx + 1} returned unexpected format")
+                last_error = AIResponseValidationError(
+                    "AI response contained no sections",
+                    details=response_text
+                )
+                continue
+            
+            _SECTIONS_ADAPTER.validate_python(sections_array)
+            chunk_sections = sections_array
+            logger.info(f"  Chunk {chunk_idx + 1} parsed {len(sections_array)} sections")
+            for i, sec in enumerate(sections_array):
+                title = sec.get("title", "")
+                body = sec.get("body", "")
+                logger.info(f"    Section {i+1}: '{title[:40]}' ({len(body)} items)")
+            _chunk_cache.put(cache_key, {"sections": chunk_sections})
+            break  # Success, exit retry loop
+                
+        except ValidationError as e:
+            logger.error(f"  Chunk {chunk_idx + 1} validation error: {e}")
+            last_error = AIResponseValidationError(
+                f"AI response validation failed: {str(e)}",
+                details=str(e)
+            )
+        except orjson.JSONDecodeError as e:
+            logger.error(f"  Chunk {chunk_idx + 1} JSON decode error: {e}")
+            last_error = AIResponseValidationError(
+                f"AI response is not valid JSON: {str(e)}",
+                details=response_text if 'response_text' in locals() else None
+            )
+            # Not transient - retry straight away with a nudge towards valid JSON
+            if messages[-1] is not _CORRECTIVE_MESSAGE:
+                messages = [*messages, _CORRECTIVE_MESSAGE]
+        except Exception as e:
+            if _is_context_length_error(e):
+                raise _ContextLengthExceeded() from e
+            logger.error(f"  Chunk {chunk_idx + 1} API error: {e}")
+            if isinstance(e, APITimeoutError) or "timeout" in str(e).lower():
+                last_error = GroqAPIError(f"Groq API timeout: {str(e)}")
+            else:
+                last_error = GroqAPIError(f"Groq API error: {str(e)}")
+            
+            if not _is_retryable(e):
+                logger.error(f"  Chunk {chunk_idx + 1} error is not retryable")
+                break
+            _groq_breaker.record_failure()
+            if attempt < max_retries and _groq_breaker.allow():
+                delay = _retry_delay(attempt, e)
+                logger.info(f"  Chunk {chunk_idx + 1} retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+    
+    return chunk_sections
+
+
+def _chunk_key(prompt: str) -> str:
+    """Chunk cache key for a single-chunk mapping prompt."""
+    return chunk_cache_key(get_settings().groq_mapper_model, SECTION_MAPPING_SYSTEM_PROMPT, prompt)
+
+
+async def _prefetch_marshaled_chunks(
+    client: AsyncGroq,
+    prompts: list[str],
+    chunk_texts: list[str],
+    marshal_size: int,
+    semaphore: asyncio.Semaphore,
+    request_options: dict[str, Any]
+) -> None:
+    """
+    Map uncached chunks in groups of marshal_size, one request per group, so
+    the instruction prefix and round trip are paid once per group. Results
+    are stored in the chunk cache; failures are left for per-chunk mapping.
+    """
+    uncached = [idx for idx, prompt in enumerate(prompts) if _chunk_key(prompt) not in _chunk_cache]
+    groups = [uncached[i:i + marshal_size] for i in range(0, len(uncached), marshal_size)]
+    
+    async def run(group: list[int]) -> None:
+        async with semaphore:
+            await _map_marshaled_group(client, group, prompts, chunk_texts, request_options)
+    
+    await asyncio.gather(*(run(group) for group in groups if len(group) > 1))
+
+
+async def _map_marshaled_group(
+    client: AsyncGroq,
+    group: list[int],
+    prompts: list[str],
+    chunk_texts: list[str],
+    request_options: dict[str, Any]
+) -> None:
+    """Map one group of chunks in a single request (one attempt, no retries)."""
+    settings = get_settings()
+    label = f"Chunks {group[0] + 1}-{group[-1] + 1}"
+    if not _groq_breaker.allow():
+        return
     
-    return json.loads(text)
+    prompt = _build_multichunk_prompt([chunk_texts[idx] for idx in group])
+    logger.info(f"{label}: marshaled into one request")
+    try:
+        completion = await _hedged_completion(
+            client,
+            model=settings.groq_mapper_model,
+            messages=[
+                {"role": "system", "content": SECTION_MAPPING_SYSTEM_PROMPT},
+                {"role": "system", "content": _MARSHAL_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.0,
+            max_tokens=_output_token_budget(prompt, settings.groq_max_output_tokens),
+            timeout=settings.groq_timeout,
+            **request_options
+        )
+        _groq_breaker.record_success()
+        parsed = orjson.loads(completion.text)
+    except orjson.JSONDecodeError as e:
+        logger.warning(f"{label}: marshaled response is not valid JSON ({e}), mapping individually")
+        return
+    except Exception as e:
+        if _is_retryable(e):
+            _groq_breaker.record_failure()
+        logger.warning(f"{label}: marshaled request failed ({e}), mapping individually")
+        return
+    
+    chunk_lists = parsed.get("chunks") if isinstance(parsed, dict) else None
+    if (
+        not isinstance(chunk_lists, list)
+        or len(chunk_lists) != len(group)
+        or not all(isinstance(sections, list) for sections in chunk_lists)
+    ):
+        logger.warning(f"{label}: marshaled response has the wrong shape, mapping individually")
+        return
+    try:
+        for sections in chunk_lists:
+            _SECTIONS_ADAPTER.validate_python(sections)
+    except ValidationError as e:
+        logger.warning(f"{label}: marshaled response failed validation ({e}), mapping individually")
+        return
+    
+    for idx, sections in zip(group, chunk_lists):
+        _chunk_cache.put(_chunk_key(prompts[idx]), {"sections": sections})
+
+
+def _output_token_budget(prompt: str, limit: int) -> int:
+    """
+    max_tokens for a chunk: the output copies the source verbatim plus JSON
+    framing, so budget ~1.5x the input with headroom. Input tokens are
+    estimated as UTF-8 bytes / 3, which over-counts English (~4 chars per
+    token) and stays safe for non-Latin scripts.
+    """
+    return min(limit, int(_estimate_tokens(prompt) * 1.5) + 512)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: UTF-8 bytes / 3 (see _output_token_budget)."""
+    return len(text.encode()) // 3
+
+
+# Client errors that will fail the same way on every attempt
+_NON_RETRYABLE_STATUS = frozenset({400, 401, 403, 404, 422})
+
+# Sent on the retry after a response that wasn't valid JSON
+_CORRECTIVE_MESSAGE = {
+    "role": "system",
+    "content": 'Your previous response was not valid JSON. Return ONLY a JSON object of the form {"sections": [...]}.'
+}
+
+
+class _ContextLengthExceeded(Exception):
+    """A chunk's request is too long for the model; retrying can't help."""
+
+
+def _is_context_length_error(error: Exception) -> bool:
+    """Whether Groq rejected the request for exceeding the context window."""
+    if not isinstance(error, APIStatusError) or error.status_code not in (400, 413):
+        return False
+    return "context_length_exceeded" in str(error.body) or "context_length_exceeded" in str(error)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a Groq call failure is worth retrying."""
+    if isinstance(error, APIStatusError):
+        return error.status_code not in _NON_RETRYABLE_STATUS
+    return True
+
+
+def _retry_delay(attempt: int, error: Exception | None = None) -> float:
+    """
+    Exponential backoff with jitter for the given attempt (0-based), honouring
+    a Retry-After header on rate-limited responses.
+    """
+    settings = get_settings()
+    if isinstance(error, APIStatusError) and error.status_code == 429:
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            return min(float(retry_after), settings.groq_retry_max_delay)
+        except (TypeError, ValueError):
+            pass
+    base = settings.groq_retry_base_delay
+    return min(base * 2 ** attempt + random.uniform(0, base), settings.groq_retry_max_delay)
+
+
+def _parse_ai_response(response_text: str) -> Any:
+    """
+    Parse the AI response, unwrapping the JSON-mode {"sections": [...]} object.
+    A markdown fence (possible when JSON mode is disabled) is sliced off.
+    """
+    payload = response_text.strip()
+    if payload.startswith("```"):
+        # Drop the opening fence line (with any language tag) and closing fence
+        payload = payload.partition("\n")[2].removesuffix("```")
+    parsed = orjson.loads(payload)
+    if isinstance(parsed, dict) and isinstance(parsed.get("sections"), list):
+        return parsed["sections"]
+    return parsed
 
 
 def _fallback_sequential_mapping(
@@ -557,31 +820,21 @@ def _fallback_sequential_mapping(
     if not content.blocks:
         for sec in analysis.sections:
             mappings[sec.section_id] = ""
-        return SectionMapping(mappings=mappings)
+        return SectionMapping.model_construct(mappings=mappings)
     
-    # Distribute blocks evenly across sections
+    # Distribute blocks evenly across sections in a single pass;
+    # the last section takes whatever remains
     blocks_per_section = max(1, len(content.blocks) // len(analysis.sections))
-    block_idx = 0
-    
-    for sec in analysis.sections:
-        section_content = []
-        for _ in range(blocks_per_section):
-            if block_idx < len(content.blocks):
-                section_content.append(content.blocks[block_idx].content)
-                block_idx += 1
-        
-        mappings[sec.section_id] = "\n\n".join(section_content)
-    
-    # Add remaining blocks to last section
-    if block_idx < len(content.blocks):
-        remaining = [b.content for b in content.blocks[block_idx:]]
-        last_section = analysis.sections[-1].section_id
-        if mappings[last_section]:
-            mappings[last_section] += "\n\n" + "\n\n".join(remaining)
-        else:
-            mappings[last_section] = "\n\n".join(remaining)
-    
-    return SectionMapping(mappings=mappings)
+    blocks_iter = iter(content.blocks)
+    last_idx = len(analysis.sections) - 1
+    
+    for idx, sec in enumerate(analysis.sections):
+        take = None if idx == last_idx else blocks_per_section
+        mappings[sec.section_id] = "\n\n".join(
+            map(_get_content, islice(blocks_iter, take))
+        )
+    
+    return SectionMapping.model_construct(mappings=mappings)
 
 
 # Backwards compatibility alias
@@ -2,12 +2,20 @@
 Template analyzer for target documents.
 Uses section-based analysis: identifies Heading + Body pairs to create semantic sections.
 """
+import asyncio
+import dataclasses
+import hashlib
 import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Literal
+from typing import Literal, NamedTuple, TypeVar
 
 from pydantic import BaseModel
 
+from app.core.config import get_settings
 from app.core.exceptions import (
     AnalysisError,
     ParsingError, 
@@ -17,6 +25,45 @@ from app.core.exceptions import (
 logger = logging.getLogger(__name__)
 
 
+# Structural keywords in paragraph style names, matched in one scan
+_STYLE_KEYWORD_RE = re.compile(r"heading(?P<level_one> 1)?|toc|header|footer", re.IGNORECASE)
+
+# Keywords that rule a style out as the template's body style
+_NON_BODY_KEYWORDS = frozenset({"heading", "toc"})
+
+# Clark-notation tag of a DrawingML picture
+_PIC_TAG = "{http://schemas.openxmlformats.org/drawingml/2006/picture}pic"
+
+# Clark-notation tags of the run properties read for template DNA
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_VAL = f"{_W_NS}val"
+_W_RFONTS = f"{_W_NS}rFonts"
+_W_SZ = f"{_W_NS}sz"
+_W_B = f"{_W_NS}b"
+_W_I = f"{_W_NS}i"
+_W_COLOR = f"{_W_NS}color"
+
+# Height (points) of the region at the top of each PDF page read for its
+# title and preview
+_PDF_PREVIEW_HEIGHT = 200
+
+
+@lru_cache(maxsize=256)
+def _style_keywords(style_name: str) -> frozenset[str]:
+    """
+    Structural keywords contained in a style name ("heading 1" also counts
+    as "heading"). Templates use a handful of styles, so each distinct name
+    is classified once.
+    """
+    keywords = set()
+    for match in _STYLE_KEYWORD_RE.finditer(style_name):
+        if match.group("level_one"):
+            keywords.update(("heading 1", "heading"))
+        else:
+            keywords.add(match.group(0).lower())
+    return frozenset(keywords)
+
+
 class TemplateSection(BaseModel):
     """A section in the template: heading + body content."""
     section_id: str
@@ -28,8 +75,13 @@ class TemplateSection(BaseModel):
     section_type: Literal["title", "section", "subsection"]
 
 
-class TemplateDNA(BaseModel):
-    """Template styling DNA for reconstruction."""
+@dataclasses.dataclass(slots=True, frozen=True, kw_only=True)
+class TemplateDNA:
+    """
+    Template styling DNA for reconstruction.
+    A plain frozen dataclass: it is built once per analysis from values read
+    straight out of the template, so there is nothing for pydantic to check.
+    """
     heading_style_name: str
     heading_font_name: str | None = None
     heading_font_size: int | None = None  # In points
@@ -69,9 +121,82 @@ class TemplateAnalysis(BaseModel):
     template_dna: TemplateDNA | None = None  # Template DNA for reconstruction
 
 
+_ModelT = TypeVar("_ModelT", bound=BaseModel)
+
+
+def _build(model: type[_ModelT], **fields) -> _ModelT:
+    """
+    Create an analysis model from values the analyzer computed itself,
+    skipping pydantic validation; in debug mode the models are validated.
+    """
+    if get_settings().debug:
+        return model(**fields)
+    return model.model_construct(**fields)
+
+
+class _RunFont(NamedTuple):
+    """Direct (run-level) font formatting of a DOCX run."""
+    name: str | None = None
+    size: int | None = None  # Whole points
+    bold: bool | None = None
+    italic: bool | None = None
+    color: str | None = None  # RRGGBB hex
+
+
+def _run_font(run) -> _RunFont:
+    """
+    Read a run's direct font formatting in one pass over its w:rPr children.
+    Matches the run.font values used before (rFonts ascii, sz in half-points,
+    on/off toggles, explicit non-auto color) without a proxy and XPath query
+    per property.
+    """
+    rpr = run._r.rPr
+    if rpr is None:
+        return _RunFont()
+    
+    name = size = bold = italic = color = None
+    for child in rpr:
+        tag = child.tag
+        if tag == _W_RFONTS:
+            name = child.get(f"{_W_NS}ascii")
+        elif tag == _W_SZ:
+            size = int(int(child.get(_W_VAL)) / 2)
+        elif tag == _W_B:
+            bold = child.get(_W_VAL, "true") in ("1", "true", "on")
+        elif tag == _W_I:
+            italic = child.get(_W_VAL, "true") in ("1", "true", "on")
+        elif tag == _W_COLOR:
+            val = child.get(_W_VAL)
+            if val and val != "auto":
+                color = val.upper()
+    return _RunFont(name, size, bold, italic, color)
+
+
+def _paragraph_style_name(para, cache: dict[str | None, str]) -> str:
+    """
+    Style name of a DOCX paragraph, memoized per style ID for one document.
+    Reading para.style builds a style proxy and searches the styles part on
+    every access; the raw w:pStyle value is a cheap attribute read.
+    """
+    style_id = para._p.style  # None means the default paragraph style
+    name = cache.get(style_id)
+    if name is None:
+        style = para.style
+        name = cache[style_id] = style.name if style else "Normal"
+    return name
+
+
+# Analyses of recently seen templates, keyed on (file name, content digest).
+# Uploads land in a fresh job directory each time, so the path alone never
+# repeats; the content does when the same template is reused.
+_template_cache: OrderedDict[tuple[str, str], TemplateAnalysis] = OrderedDict()
+_template_cache_lock = threading.Lock()  # analyze_template runs in worker threads
+
+
 def analyze_template(file_path: Path) -> TemplateAnalysis:
     """
     Analyze a template document to detect sections (Heading + Body pairs).
+    Results are cached by file content; each call returns its own copy.
     
     Args:
         file_path: Path to the template document
@@ -82,13 +207,61 @@ def analyze_template(file_path: Path) -> TemplateAnalysis:
     suffix = file_path.suffix.lower()
     
     if suffix == ".docx":
-        return _analyze_docx_sections(file_path)
+        analyze = _analyze_docx_sections
     elif suffix == ".pptx":
-        return _analyze_pptx_sections(file_path)
+        analyze = _analyze_pptx_sections
     elif suffix == ".pdf":
-        return _analyze_pdf_sections(file_path)
+        analyze = _analyze_pdf_sections
     else:
         raise UnsupportedFileTypeError(f"Unsupported template type: {suffix}")
+    
+    maxsize = get_settings().template_cache_size
+    if maxsize <= 0:
+        return analyze(file_path)
+    
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    key = (file_path.name, digest.hexdigest())
+    
+    with _template_cache_lock:
+        cached = _template_cache.get(key)
+        if cached is not None:
+            _template_cache.move_to_end(key)
+    if cached is not None:
+        logger.info(f"Template analysis cache hit: {file_path.name} ({key[1][:12]})")
+        return cached.model_copy(deep=True)
+    
+    analysis = analyze(file_path)
+    with _template_cache_lock:
+        _template_cache[key] = analysis
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > maxsize:
+            _template_cache.popitem(last=False)
+    return analysis.model_copy(deep=True)
+
+
+async def analyze_templates(
+    paths: list[Path],
+    max_concurrency: int | None = None
+) -> list[TemplateAnalysis | BaseException]:
+    """
+    Analyze several templates in worker threads, at most max_concurrency
+    at a time (defaults to settings.template_max_concurrency).
+    
+    Results keep the input order; a template that fails to analyze yields
+    its exception in place instead of failing the whole batch.
+    """
+    if max_concurrency is None:
+        max_concurrency = get_settings().template_max_concurrency
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def analyze_one(path: Path) -> TemplateAnalysis:
+        async with semaphore:
+            return await asyncio.to_thread(analyze_template, path)
+    
+    return await asyncio.gather(*(analyze_one(path) for path in paths), return_exceptions=True)
 
 
 def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
@@ -98,9 +271,15 @@ def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
     """
     try:
         from docx import Document
+        from docx.text.paragraph import Paragraph
         
         doc = Document(str(file_path))
-        total_paras = len(doc.paragraphs)
+        # doc.paragraphs wraps every w:p in a Paragraph proxy, but the scan
+        # stops at the first Heading 1; take the raw elements once and wrap
+        # only the ones actually visited
+        p_elements = doc.element.body.p_lst
+        total_paras = len(p_elements)
+        style_names: dict[str | None, str] = {}
         
         logger.info(f"Analyzing DOCX template: {file_path.name} ({total_paras} paragraphs)")
         
@@ -120,32 +299,36 @@ def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
         body_font_italic = None
         safe_zone_end = 0
         
-        for idx, para in enumerate(doc.paragraphs):
+        for idx, p_element in enumerate(p_elements):
+            para = Paragraph(p_element, doc)
+            # Only the style decides whether to stop here; the text (which
+            # joins every run) is read just for Heading 1 candidates
+            style_name = _paragraph_style_name(para, style_names)
+            if "heading 1" not in _style_keywords(style_name):
+                continue
+            
             text = para.text.strip()
             if not text:
                 continue
             
-            style_name = para.style.name if para.style else "Normal"
-            style_lower = style_name.lower()
-            
             # Look for first Heading 1
-            if "heading 1" in style_lower and first_heading_idx == -1:
+            if first_heading_idx == -1:
                 first_heading_idx = idx
                 heading_style_name = style_name
                 safe_zone_end = idx  # Everything before this is the safe zone
                 
                 # Extract font properties from heading
                 if para.runs:
-                    first_run = para.runs[0]
-                    heading_font_name = first_run.font.name or (para.style.font.name if para.style else None)
-                    if first_run.font.size:
-                        heading_font_size = int(first_run.font.size.pt)
+                    run_font = _run_font(para.runs[0])
+                    heading_font_name = run_font.name or (para.style.font.name if para.style else None)
+                    if run_font.size is not None:
+                        heading_font_size = run_font.size
                     elif para.style and para.style.font.size:
                         heading_font_size = int(para.style.font.size.pt)
                         
                     # Extract color (check run then style)
-                    if first_run.font.color and first_run.font.color.rgb:
-                        heading_font_color = str(first_run.font.color.rgb)
+                    if run_font.color:
+                        heading_font_color = run_font.color
                     elif para.style and para.style.font.color and para.style.font.color.rgb:
                         heading_font_color = str(para.style.font.color.rgb)
                 
@@ -156,24 +339,21 @@ def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
                 
                 # Next non-empty, non-heading paragraph is the body style
                 for body_idx in range(idx + 1, min(idx + 10, total_paras)):
-                    body_para = doc.paragraphs[body_idx]
+                    body_para = Paragraph(p_elements[body_idx], doc)
                     body_text = body_para.text.strip()
                     if body_text:
-                        body_style = body_para.style.name if body_para.style else "Normal"
-                        body_style_lower = body_style.lower()
-                        if "heading" not in body_style_lower and "toc" not in body_style_lower:
+                        body_style = _paragraph_style_name(body_para, style_names)
+                        if not _style_keywords(body_style) & _NON_BODY_KEYWORDS:
                             body_style_name = body_style
                             
                             # Extract font properties from body
                             if body_para.runs:
-                                first_body_run = body_para.runs[0]
-                                body_font_name = first_body_run.font.name
-                                if first_body_run.font.size:
-                                    body_font_size = int(first_body_run.font.size.pt)
-                                body_font_bold = first_body_run.font.bold
-                                body_font_italic = first_body_run.font.italic
-                                if first_body_run.font.color and first_body_run.font.color.rgb:
-                                    body_font_color = str(first_body_run.font.color.rgb)
+                                run_font = _run_font(body_para.runs[0])
+                                body_font_name = run_font.name
+                                body_font_size = run_font.size
+                                body_font_bold = run_font.bold
+                                body_font_italic = run_font.italic
+                                body_font_color = run_font.color
                             
                             logger.info(f"  Found master body at para {body_idx}:")
                             logger.info(f"    Style: '{body_style}'")
@@ -205,7 +385,8 @@ def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
         logger.info(f"    First content section: {first_heading_idx}")
         
         # Create a single section for compatibility
-        section = TemplateSection(
+        section = _build(
+            TemplateSection,
             section_id="sec_all",
             heading_text="Document",
             heading_paragraph_idx=-1,
@@ -215,7 +396,8 @@ def _analyze_docx_sections(file_path: Path) -> TemplateAnalysis:
             section_type="section"
         )
         
-        return TemplateAnalysis(
+        return _build(
+            TemplateAnalysis,
             sections=[section],
             section_ids=["sec_all"],
             template_file=file_path.name,
@@ -235,8 +417,8 @@ def _is_structural_paragraph(para, style_name: str, text: str) -> bool:
     """
     # Check for images or shapes - these are STRUCTURAL
     try:
-        # Check if paragraph contains images
-        if para._element.xpath('.//pic:pic'):
+        # Check if paragraph contains images (stops at the first one)
+        if next(para._element.iter(_PIC_TAG), None) is not None:
             return True  # Has images - preserve
     except Exception:
         pass
@@ -244,10 +426,10 @@ def _is_structural_paragraph(para, style_name: str, text: str) -> bool:
     # Check if in header/footer section (not just "Header" style)
     try:
         # This is more complex - for now, we'll classify by style
-        style_lower = style_name.lower()
-        if 'header' in style_lower or 'footer' in style_lower:
+        keywords = _style_keywords(style_name)
+        if 'header' in keywords or 'footer' in keywords:
             # Only if it's an actual header/footer style (not "Heading")
-            if 'heading' not in style_lower:
+            if 'heading' not in keywords:
                 return True
     except Exception:
         pass
@@ -268,32 +450,29 @@ def _analyze_pptx_sections(file_path: Path) -> TemplateAnalysis:
         section_ids: list[str] = []
         
         for slide_idx, slide in enumerate(prs.slides):
-            title_text = f"Slide {slide_idx + 1}"
-            body_preview = ""
+            # The title placeholder is located directly rather than by
+            # probing every shape's placeholder type
+            title_shape = slide.shapes.title
+            title_id = title_shape.shape_id if title_shape is not None else None
+            title_text = ""
+            if title_shape is not None and title_shape.has_text_frame:
+                title_text = title_shape.text_frame.text.strip()
             
+            # Preview is the first non-empty text outside the title
+            body_preview = ""
             for shape in slide.shapes:
-                if not shape.has_text_frame:
+                if shape.shape_id == title_id or not shape.has_text_frame:
                     continue
-                
                 text = shape.text_frame.text.strip()
-                if not text:
-                    continue
-                
-                # Check if title
-                is_title = False
-                if hasattr(shape, "placeholder_format") and shape.placeholder_format:
-                    ph_type = shape.placeholder_format.type
-                    if ph_type in [1, 2, 3]:
-                        is_title = True
-                        title_text = text
-                
-                if not is_title and not body_preview:
+                if text:
                     body_preview = text[:100]
+                    break
             
             section_id = f"slide_{slide_idx}"
-            sections.append(TemplateSection(
+            sections.append(_build(
+                TemplateSection,
                 section_id=section_id,
-                heading_text=title_text,
+                heading_text=title_text or f"Slide {slide_idx + 1}",
                 heading_paragraph_idx=slide_idx,
                 body_start_idx=slide_idx,
                 body_end_idx=slide_idx + 1,
@@ -302,7 +481,8 @@ def _analyze_pptx_sections(file_path: Path) -> TemplateAnalysis:
             ))
             section_ids.append(section_id)
         
-        return TemplateAnalysis(
+        return _build(
+            TemplateAnalysis,
             sections=sections,
             section_ids=section_ids,
             template_file=file_path.name,
@@ -321,32 +501,39 @@ def _analyze_pdf_sections(file_path: Path) -> TemplateAnalysis:
     try:
         import fitz
         
-        doc = fitz.open(str(file_path))
         sections: list[TemplateSection] = []
         section_ids: list[str] = []
         
-        for page_idx, page in enumerate(doc):
-            text = page.get_text()
-            lines = text.strip().split('\n')
-            
-            title = lines[0][:50] if lines else f"Page {page_idx + 1}"
-            body_preview = ' '.join(lines[1:5])[:100] if len(lines) > 1 else ""
-            
-            section_id = f"page_{page_idx}"
-            sections.append(TemplateSection(
-                section_id=section_id,
-                heading_text=title,
-                heading_paragraph_idx=page_idx,
-                body_start_idx=page_idx,
-                body_end_idx=page_idx + 1,
-                body_preview=body_preview,
-                section_type="section"
-            ))
-            section_ids.append(section_id)
-        
-        doc.close()
+        with fitz.open(str(file_path), filetype="pdf") as doc:
+            for page_idx, page in enumerate(doc):
+                # Only the top of the page feeds the title and preview, so clip
+                # extraction to it instead of materializing the whole page
+                top = fitz.Rect(0, 0, page.rect.width, min(page.rect.height, _PDF_PREVIEW_HEIGHT))
+                # flags=0: no ligature or whitespace preservation post-processing
+                text = page.get_text("text", clip=top, sort=True, flags=0).strip()
+                if not text:
+                    # Content starts lower down the page (e.g. a large top margin)
+                    text = page.get_text("text", sort=True, flags=0).strip()
+                lines = text.split('\n')
+                
+                title = lines[0][:50] or f"Page {page_idx + 1}"
+                body_preview = ' '.join(lines[1:5])[:100] if len(lines) > 1 else ""
+                
+                section_id = f"page_{page_idx}"
+                sections.append(_build(
+                    TemplateSection,
+                    section_id=section_id,
+                    heading_text=title,
+                    heading_paragraph_idx=page_idx,
+                    body_start_idx=page_idx,
+                    body_end_idx=page_idx + 1,
+                    body_preview=body_preview,
+                    section_type="section"
+                ))
+                section_ids.append(section_id)
         
-        return TemplateAnalysis(
+        return _build(
+            TemplateAnalysis,
             sections=sections,
             section_ids=section_ids,
             template_file=file_path.name,
@@ -361,9 +548,8 @@ def get_section_descriptions(analysis: TemplateAnalysis) -> str:
     """
     Generate descriptions of template sections for AI prompt.
     """
-    lines = []
-    for sec in analysis.sections:
-        context = f" (Context: '{sec.body_preview[:80]}...')" if sec.body_preview else ""
-        lines.append(f"- {sec.section_id}: \"{sec.heading_text}\"{context}")
-    
-    return "\n".join(lines)
+    return "\n".join([
+        f"- {sec.section_id}: \"{sec.heading_text}\""
+        + (f" (Context: '{sec.body_preview[:80]}...')" if sec.body_preview else "")
+        for sec in analysis.sections
+    ])
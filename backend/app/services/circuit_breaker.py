@@ -0,0 +1,50 @@
+"""
+Circuit breaker for outbound API calls.
+After repeated consecutive failures, calls are short-circuited for a cool-off
+period so requests fall back immediately instead of waiting on timeouts.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: calls pass through. After failure_threshold consecutive failures
+    it opens for reset_seconds and allow() returns False. Once the period
+    ends it is half-open: calls pass again, a success closes it and a single
+    failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self._name = name
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._open_until = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now."""
+        return not self.is_open
+
+    def record_success(self) -> None:
+        if self._failures:
+            logger.info(f"{self._name} circuit closed")
+        self._failures = 0
+        self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= self._failure_threshold and not self.is_open:
+            self._open_until = time.monotonic() + self._reset_seconds
+            logger.warning(
+                f"{self._name} circuit opened after {self._failures} consecutive failures "
+                f"(retrying in {self._reset_seconds:.0f}s)"
+            )
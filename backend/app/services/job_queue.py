@@ -0,0 +1,134 @@
+"""
+In-process job queue with a bounded worker pool.
+Decouples request handling from the document pipeline so concurrent uploads
+queue up instead of thrashing the AI and PDF conversion steps.
+"""
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+from app.services.temp_sweeper import job_id_timestamp_ms
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(BaseModel):
+    """Status of a queued processing job."""
+    job_id: str
+    status: Literal["queued", "processing", "completed", "failed"]
+    download_url: str | None = None
+    error: str | None = None
+
+
+# Handler receives the job payload and returns the download URL
+JobHandler = Callable[[str, dict[str, Any]], Awaitable[str]]
+# Maps a handler exception to a user-facing error message
+ErrorFormatter = Callable[[Exception], str]
+
+
+class JobQueue:
+    """asyncio.Queue backed by a fixed pool of worker tasks."""
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        concurrency: int,
+        error_formatter: ErrorFormatter = str,
+        ttl_seconds: float | None = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self._handler = handler
+        self._concurrency = max(1, concurrency)
+        self._error_formatter = error_formatter
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock  # Wall-clock seconds, comparable with UUIDv7 timestamps
+        self._queue: asyncio.Queue[tuple[str, dict[str, Any]]] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self.jobs: dict[str, JobStatus] = {}
+
+    async def start(self) -> None:
+        """Launch the worker tasks."""
+        for idx in range(self._concurrency):
+            self._workers.append(asyncio.create_task(self._worker_loop(idx)))
+        logger.info(f"Job queue started with {self._concurrency} workers")
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks and wait for them to exit."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def submit(self, job_id: str, payload: dict[str, Any]) -> JobStatus:
+        """Enqueue a job and return its initial status."""
+        self._expire_old_jobs()
+        status = JobStatus(job_id=job_id, status="queued")
+        self.jobs[job_id] = status
+        await self._queue.put((job_id, payload))
+        logger.info(f"Job {job_id} queued (depth={self._queue.qsize()})")
+        return status
+
+    def get(self, job_id: str) -> JobStatus | None:
+        """Look up the status of a job."""
+        self._expire_old_jobs()
+        return self.jobs.get(job_id)
+
+    def is_active(self, job_id: str) -> bool:
+        """Whether a job is still queued or processing."""
+        status = self.jobs.get(job_id)
+        return status is not None and status.status in ("queued", "processing")
+
+    def forget(self, job_id: str) -> None:
+        """Drop a job's status entry."""
+        self.jobs.pop(job_id, None)
+
+    def _expire_old_jobs(self) -> None:
+        """
+        Drop finished jobs older than the TTL, in step with the sweeper that
+        removes their directories. The age comes from the UUIDv7 job ID;
+        entries are inserted in creation order, so the scan stops at the
+        first young job.
+        """
+        if not self._ttl_seconds:
+            return
+        
+        cutoff_ms = (self._clock() - self._ttl_seconds) * 1000
+        expired = []
+        for job_id, status in self.jobs.items():
+            created_ms = job_id_timestamp_ms(job_id)
+            if created_ms is None:
+                continue  # Not a UUIDv7 job ID
+            if created_ms >= cutoff_ms:
+                break
+            if status.status in ("completed", "failed"):
+                expired.append(job_id)
+        
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker_loop(self, worker_idx: int) -> None:
+        """Pull jobs off the queue and run them until cancelled."""
+        while True:
+            job_id, payload = await self._queue.get()
+            status = self.jobs.get(job_id)
+            if status is None:
+                status = JobStatus(job_id=job_id, status="queued")
+                self.jobs[job_id] = status
+
+            status.status = "processing"
+            logger.info(f"Worker {worker_idx} processing job {job_id}")
+            try:
+                status.download_url = await self._handler(job_id, payload)
+                status.status = "completed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                status.error = self._error_formatter(e)
+                status.status = "failed"
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,142 @@
+"""
+Incremental parser for streamed LLM output.
+Splits a JSON array of objects into its elements as soon as each one closes,
+so decoding overlaps with token generation.
+"""
+from typing import Any
+
+import orjson
+
+
+class ArrayStreamParser:
+    """
+    Feed text fragments of a top-level JSON array of objects; each object is
+    decoded as soon as its closing brace arrives.
+
+    The array is either the root value or the value of the root object's
+    "sections" key (the wrapper of a JSON-mode response). Text before the
+    root value (such as a markdown fence), the root object's other members,
+    and anything after the closing ']' are ignored. If the stream turns out
+    not to be a clean array of objects, `failed` is set and the caller should
+    fall back to parsing the full text.
+    """
+
+    def __init__(self):
+        self.items: list[Any] = []
+        self.failed = False
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: list[str] = []  # Fragments of the object being read
+        # Preamble state, while looking for the array inside a root object
+        self._wrapper_depth = 0
+        self._expect_key = False
+        self._key_chars: list[str] | None = None  # Root-level key being read
+        self._key: str | None = None  # Key whose value comes next
+
+    @property
+    def complete(self) -> bool:
+        """True once the whole array has been read without errors."""
+        return self.closed and not self.failed
+
+    def feed(self, fragment: str) -> None:
+        """Consume the next fragment of streamed text."""
+        if self.failed or self.closed:
+            return
+
+        start = 0 if self._depth >= 2 else None
+        for idx, char in enumerate(fragment):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._key = "".join(self._key_chars)
+                        self._key_chars = None
+                    continue
+                if self._key_chars is not None:
+                    self._key_chars.append(char)
+                continue
+
+            if self._depth == 0:
+                if not self._scan_preamble(char):
+                    return
+                continue
+
+            if char == '"':
+                if self._depth < 2:
+                    self.failed = True  # Only objects are expected in the array
+                    return
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+                if self._depth == 2:
+                    if char != "{":
+                        self.failed = True
+                        return
+                    start = idx
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._current.append(fragment[start:idx + 1])
+                    start = None
+                    if not self._finish_item():
+                        return
+                elif self._depth == 0:
+                    self.closed = True
+                    return
+
+        if start is not None:
+            self._current.append(fragment[start:])
+
+    def _scan_preamble(self, char: str) -> bool:
+        """
+        Track one character outside the array; sets _depth to 1 once the
+        array opens. Returns False if the root object closed without a
+        "sections" array.
+        """
+        if self._wrapper_depth == 0:
+            if char == "[":
+                self._depth = 1  # Bare root array
+            elif char == "{":
+                self._wrapper_depth = 1
+                self._expect_key = True
+            return True  # Anything else is text around the JSON
+
+        if char == '"':
+            self._in_string = True
+            if self._wrapper_depth == 1 and self._expect_key:
+                self._key_chars = []
+        elif self._wrapper_depth > 1:
+            if char in "[{":
+                self._wrapper_depth += 1
+            elif char in "]}":
+                self._wrapper_depth -= 1
+        elif char == ":":
+            self._expect_key = False
+        elif char == ",":
+            self._expect_key = True
+            self._key = None
+        elif char == "[" and self._key == "sections":
+            self._depth = 1
+        elif char in "[{":
+            self._wrapper_depth += 1
+        elif char in "]}":
+            self.failed = True
+            return False
+        return True
+
+    def _finish_item(self) -> bool:
+        """Decode the buffered object; returns False on failure."""
+        text = "".join(self._current)
+        self._current.clear()
+        try:
+            self.items.append(orjson.loads(text))
+        except orjson.JSONDecodeError:
+            self.failed = True
+            return False
+        return True
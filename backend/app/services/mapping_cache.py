@@ -0,0 +1,129 @@
+"""
+Exact-match cache for AI section mappings.
+Stores serialized mappings with LRU eviction and a TTL, and coalesces
+concurrent identical requests into a single in-flight computation.
+Used both for whole documents and for individual chunk responses.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Computes a mapping; returns (mappings, cacheable)
+MappingFactory = Callable[[], Awaitable[tuple[dict[str, Any], bool]]]
+
+
+def mapping_cache_key(
+    content_text: str,
+    section_descriptions: str,
+    model: str,
+    chunk_size: int,
+    chunk_token_budget: int = 0
+) -> str:
+    """SHA-256 over everything that determines the mapping result."""
+    digest = hashlib.sha256()
+    parts = (content_text, section_descriptions, model, str(chunk_size), str(chunk_token_budget))
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def chunk_cache_key(model: str, system_prompt: str, prompt: str) -> str:
+    """SHA-256 over the exact request for a single chunk."""
+    digest = hashlib.sha256()
+    for part in (model, system_prompt, prompt):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class MappingCache:
+    """
+    LRU + TTL cache of mapping dicts, stored as orjson bytes so entries are
+    compact and every hit returns a fresh copy.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._maxsize = maxsize
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Return a copy of the cached mapping, or None if missing/expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return orjson.loads(payload)
+
+    def __contains__(self, key: str) -> bool:
+        """Whether an unexpired entry exists, without decoding it."""
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, key: str, mappings: dict[str, Any]) -> None:
+        """Store a mapping, evicting the least recently used entries when full."""
+        if self._maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self._ttl_seconds, orjson.dumps(mappings))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_compute(self, key: str, factory: MappingFactory) -> dict[str, Any]:
+        """
+        Return the cached mapping for key, or compute it. Concurrent callers
+        with the same key share one computation (single-flight). If the
+        caller running it is cancelled, the others retry instead of being
+        cancelled with it.
+        """
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                logger.info(f"AI mapping cache hit ({key[:12]})")
+                return cached
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            logger.info(f"AI mapping joining in-flight request ({key[:12]})")
+            try:
+                return orjson.loads(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # This caller was cancelled
+                logger.info(f"AI mapping in-flight request was cancelled, retrying ({key[:12]})")
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            mappings, cacheable = await factory()
+            if cacheable:
+                self.put(key, mappings)
+            future.set_result(orjson.dumps(mappings))
+            return mappings
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
@@ -2,16 +2,36 @@
 Content extraction from source documents (DOCX, PDF, PPTX).
 Extracts text blocks preserving order but ignoring original formatting.
 """
+import logging
+import mmap
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Literal
+from typing import Literal, get_args
 
 from pydantic import BaseModel
 
+from app.core.config import get_settings
 from app.core.exceptions import ParsingError, UnsupportedFileTypeError
 
+logger = logging.getLogger(__name__)
+
+# First characters that mark a line as a list item (set membership on the
+# first character beats startswith with a tuple of prefixes)
+_DOCX_BULLETS = frozenset("-•*")
+_PDF_BULLETS = frozenset("-•*►")
+
 
 class ContentBlock(BaseModel):
-    """A block of extracted content."""
+    """
+    A block of extracted content.
+    
+    The extractors create blocks with model_construct(): every field comes
+    from the extractor itself, so per-block validation is skipped.
+    """
     id: str
     type: Literal["heading", "paragraph", "list", "table"]
     content: str
@@ -23,6 +43,18 @@ class ExtractedContent(BaseModel):
     source_file: str
 
 
+def preload_document_libraries() -> None:
+    """
+    Import python-docx, python-pptx and PyMuPDF ahead of the first request.
+    The parsers, analyzer and renderer import them lazily inside functions;
+    after this, those imports are sys.modules lookups instead of a cold
+    load (lxml setup, MuPDF shared library) on the request path.
+    """
+    import docx  # noqa: F401
+    import fitz  # noqa: F401
+    import pptx  # noqa: F401
+
+
 def extract_content(file_path: Path) -> ExtractedContent:
     """
     Extract content blocks from a document.
@@ -56,7 +88,9 @@ def _extract_from_docx(file_path: Path) -> ExtractedContent:
         
         doc = Document(str(file_path))
         blocks: list[ContentBlock] = []
-        block_id = 0
+        # Block type implied by each paragraph style, keyed on the raw
+        # w:pStyle value so the style part is searched once per style
+        style_types: dict[str | None, str | None] = {}
         
         for para in doc.paragraphs:
             text = para.text.strip()
@@ -64,37 +98,49 @@ def _extract_from_docx(file_path: Path) -> ExtractedContent:
                 continue
                 
             # Determine block type based on style
-            style_name = para.style.name.lower() if para.style else ""
+            style_id = para._p.style
+            if style_id not in style_types:
+                style_name = para.style.name.lower() if para.style else ""
+                if "heading" in style_name or "title" in style_name:
+                    style_types[style_id] = "heading"
+                elif "list" in style_name:
+                    style_types[style_id] = "list"
+                else:
+                    style_types[style_id] = None
             
-            if "heading" in style_name or "title" in style_name:
-                block_type = "heading"
-            elif "list" in style_name or para.text.strip().startswith(("-", "•", "*")):
-                block_type = "list"
-            else:
-                block_type = "paragraph"
+            block_type = style_types[style_id]
+            if block_type is None:
+                block_type = "list" if text[0] in _DOCX_BULLETS else "paragraph"
             
-            blocks.append(ContentBlock(
-                id=f"b{block_id}",
+            blocks.append(ContentBlock.model_construct(
+                id=f"b{len(blocks)}",
                 type=block_type,
                 content=text
             ))
-            block_id += 1
         
-        # Extract table content
+        # Extract table content. Cell text is read from the w:tc element
+        # (skipping the paragraph proxies behind cell.text) and memoized,
+        # since merged cells repeat across the grid positions they span.
+        cell_texts: dict = {}
         for table in doc.tables:
             table_text_parts = []
             for row in table.rows:
-                row_cells = [cell.text.strip() for cell in row.cells]
+                row_cells = []
+                for cell in row.cells:
+                    tc = cell._tc
+                    cell_text = cell_texts.get(tc)
+                    if cell_text is None:
+                        cell_text = cell_texts[tc] = "\n".join(p.text for p in tc.p_lst).strip()
+                    row_cells.append(cell_text)
                 if any(row_cells):
                     table_text_parts.append(" | ".join(row_cells))
             
             if table_text_parts:
-                blocks.append(ContentBlock(
-                    id=f"b{block_id}",
+                blocks.append(ContentBlock.model_construct(
+                    id=f"b{len(blocks)}",
                     type="table",
                     content="\n".join(table_text_parts)
                 ))
-                block_id += 1
         
         return ExtractedContent(blocks=blocks, source_file=file_path.name)
         
@@ -103,44 +149,130 @@ def _extract_from_docx(file_path: Path) -> ExtractedContent:
 
 
 def _extract_from_pdf(file_path: Path) -> ExtractedContent:
-    """Extract content from PDF file."""
+    """
+    Extract content from PDF file.
+    Long PDFs are split into contiguous page ranges extracted in parallel by
+    the shared process pool; block IDs are assigned here, in page order.
+    """
     try:
-        import fitz  # PyMuPDF
+        settings = get_settings()
+        with _open_pdf(str(file_path)) as doc:
+            page_count = len(doc)
+            workers = min(settings.pdf_extract_workers, page_count)
+            if workers < 2 or page_count < settings.pdf_extract_parallel_min_pages:
+                range_blocks = [_pdf_range_blocks(doc, 0, page_count)]
+                workers = 0
         
-        doc = fitz.open(str(file_path))
-        blocks: list[ContentBlock] = []
-        block_id = 0
+        if workers:
+            range_blocks = _extract_pdf_in_pool(str(file_path), page_count, workers)
         
-        for page in doc:
-            # Extract text blocks with their positions
-            text_blocks = page.get_text("blocks")
-            
-            for block in text_blocks:
-                # block format: (x0, y0, x1, y1, text, block_no, block_type)
-                if len(block) >= 5:
-                    text = block[4].strip()
-                    if text and not text.startswith("<image"):
-                        # Simple heuristic: short lines at top might be headings
-                        block_type = "paragraph"
-                        if len(text) < 100 and text.isupper():
-                            block_type = "heading"
-                        elif text.startswith(("-", "•", "*", "►")):
-                            block_type = "list"
-                        
-                        blocks.append(ContentBlock(
-                            id=f"b{block_id}",
-                            type=block_type,
-                            content=text
-                        ))
-                        block_id += 1
+        blocks: list[ContentBlock] = []
+        for page_range in range_blocks:
+            for block_type, text in page_range:
+                blocks.append(ContentBlock.model_construct(
+                    id=f"b{len(blocks)}",
+                    type=block_type,
+                    content=text
+                ))
         
-        doc.close()
         return ExtractedContent(blocks=blocks, source_file=file_path.name)
         
     except Exception as e:
         raise ParsingError(f"Failed to parse PDF: {str(e)}", details=str(e))
 
 
+@contextmanager
+def _open_pdf(path: str):
+    """
+    Open a PDF from a read-only memory map of the file. MuPDF then reads
+    the xref and page objects straight from mapped memory instead of
+    seeking and reading through a file stream.
+    """
+    import fitz  # PyMuPDF
+    
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            with fitz.open(stream=view, filetype="pdf") as doc:
+                yield doc
+        finally:
+            view.release()  # The map can only close once no views remain
+
+
+def _pdf_range_blocks(doc, start: int, stop: int) -> list[tuple[str, str]]:
+    """Classify the text blocks of pages [start, stop) as (block type, text) pairs."""
+    import fitz  # PyMuPDF
+    
+    # Block extraction defaults, explicitly without image pseudo-blocks
+    flags = fitz.TEXTFLAGS_BLOCKS & ~fitz.TEXT_PRESERVE_IMAGES
+    range_blocks = []
+    for page_no in range(start, stop):
+        # Extract text blocks with their positions from one TextPage
+        for block in doc[page_no].get_textpage(flags=flags).extractBLOCKS():
+            # block format: (x0, y0, x1, y1, text, block_no, block_type)
+            if len(block) >= 5:
+                text = block[4].strip()
+                if text:
+                    # Simple heuristic: short lines at top might be headings
+                    block_type = "paragraph"
+                    if len(text) < 100 and text.isupper():
+                        block_type = "heading"
+                    elif text[0] in _PDF_BULLETS:
+                        block_type = "list"
+                    range_blocks.append((block_type, text))
+    return range_blocks
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> list[tuple[str, str]]:
+    """Process pool worker: classified blocks of pages [start, stop)."""
+    with _open_pdf(path) as doc:
+        return _pdf_range_blocks(doc, start, stop)
+
+
+def _extract_pdf_in_pool(path: str, page_count: int, workers: int) -> list[list[tuple[str, str]]]:
+    """
+    Extract one contiguous page range per worker; results are in page order.
+    If the pool has broken (a worker died), it is discarded and the PDF is
+    extracted in this thread instead.
+    """
+    step = -(-page_count // workers)  # Ceiling division
+    starts = range(0, page_count, step)
+    stops = [min(start + step, page_count) for start in starts]
+    try:
+        return list(_get_pdf_pool().map(_extract_pdf_pages, [path] * len(starts), starts, stops))
+    except BrokenProcessPool:
+        logger.warning("PDF extraction pool broke; extracting in-thread")
+        shutdown_pdf_pool()
+        return [_extract_pdf_pages(path, 0, page_count)]
+
+
+# Worker processes for PDF extraction, created on first use. Spawned rather
+# than forked so each worker has its own clean MuPDF state.
+_pdf_pool: ProcessPoolExecutor | None = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Return the shared PDF extraction pool, starting it if needed."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=get_settings().pdf_extract_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the PDF extraction worker processes, if they were started."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(cancel_futures=True)
+            _pdf_pool = None
+
+
 def _extract_from_pptx(file_path: Path) -> ExtractedContent:
     """Extract content from PPTX file."""
     try:
@@ -148,12 +280,17 @@ def _extract_from_pptx(file_path: Path) -> ExtractedContent:
         
         prs = Presentation(str(file_path))
         blocks: list[ContentBlock] = []
-        block_id = 0
         
         for slide_idx, slide in enumerate(prs.slides):
             for shape in slide.shapes:
                 if not shape.has_text_frame:
                     continue
+                
+                # Title shapes usually have placeholder type; resolved once
+                # per shape rather than for each of its paragraphs
+                is_placeholder = shape.is_placeholder
+                # Type 1 = Title, Type 2 = Center Title
+                is_title = is_placeholder and shape.placeholder_format.type in (1, 2, 3)
                     
                 for paragraph in shape.text_frame.paragraphs:
                     text = paragraph.text.strip()
@@ -161,22 +298,17 @@ def _extract_from_pptx(file_path: Path) -> ExtractedContent:
                         continue
                     
                     # Detect block type
-                    # Title shapes usually have placeholder type
                     block_type = "paragraph"
-                    if hasattr(shape, "placeholder_format") and shape.placeholder_format:
-                        ph_type = shape.placeholder_format.type
-                        # Type 1 = Title, Type 2 = Center Title
-                        if ph_type in [1, 2, 3]:
-                            block_type = "heading"
-                    elif paragraph.level > 0:
+                    if is_title:
+                        block_type = "heading"
+                    elif not is_placeholder and paragraph.level > 0:
                         block_type = "list"
                     
-                    blocks.append(ContentBlock(
-                        id=f"b{block_id}",
+                    blocks.append(ContentBlock.model_construct(
+                        id=f"b{len(blocks)}",
                         type=block_type,
                         content=text
                     ))
-                    block_id += 1
             
             # Extract table content from slides
             for shape in slide.shapes:
@@ -189,12 +321,11 @@ def _extract_from_pptx(file_path: Path) -> ExtractedContent:
                             table_text_parts.append(" | ".join(row_cells))
                     
                     if table_text_parts:
-                        blocks.append(ContentBlock(
-                            id=f"b{block_id}",
+                        blocks.append(ContentBlock.model_construct(
+                            id=f"b{len(blocks)}",
                             type="table",
                             content="\n".join(table_text_parts)
                         ))
-                        block_id += 1
         
         return ExtractedContent(blocks=blocks, source_file=file_path.name)
         
@@ -202,6 +333,13 @@ def _extract_from_pptx(file_path: Path) -> ExtractedContent:
         raise ParsingError(f"Failed to parse PPTX: {str(e)}", details=str(e))
 
 
+# Summary line prefix per block type, formatted once rather than per block
+_SUMMARY_PREFIXES = {
+    block_type: f"[{block_type.upper()}] "
+    for block_type in get_args(ContentBlock.model_fields["type"].annotation)
+}
+
+
 def content_to_text_summary(content: ExtractedContent) -> str:
     """
     Convert extracted content to a text summary for AI processing.
@@ -212,9 +350,13 @@ def content_to_text_summary(content: ExtractedContent) -> str:
     Returns:
         Formatted text summary
     """
-    lines = []
-    for block in content.blocks:
-        prefix = f"[{block.type.upper()}]"
-        lines.append(f"{prefix} {block.content}")
-    
-    return "\n\n".join(lines)
+    return blocks_to_text_summary(content.blocks)
+
+
+def blocks_to_text_summary(blocks: list[ContentBlock]) -> str:
+    """
+    Format content blocks as a text summary for AI processing.
+    Summaries of consecutive slices joined with a blank line equal the
+    summary of the whole list.
+    """
+    return "\n\n".join([_SUMMARY_PREFIXES[block.type] + block.content for block in blocks])
@@ -2,6 +2,7 @@
 PDF conversion service using ConvertAPI.
 Converts DOCX files to PDF format using cloud API.
 """
+import asyncio
 import logging
 from pathlib import Path
 import httpx
@@ -11,18 +12,54 @@ from app.core.exceptions import RenderingError
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MB, so each write is worth a thread hop
+
 
 class PDFConversionError(RenderingError):
     """Exception raised when PDF conversion fails."""
     pass
 
 
+# Shared ConvertAPI client - keep-alive connections (and their TLS sessions)
+# are reused across conversions
+_client: httpx.AsyncClient | None = None
+_client_lock = asyncio.Lock()
+
+
+async def get_convertapi_client() -> httpx.AsyncClient:
+    """Get the shared ConvertAPI HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                settings = get_settings()
+                # Each conversion is a single request whose response is the
+                # PDF, so keep one idle connection per conversion slot
+                _client = httpx.AsyncClient(
+                    timeout=120.0,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=max(1, settings.pdf_concurrency),
+                        keepalive_expiry=30.0
+                    )
+                )
+    return _client
+
+
+async def close_convertapi_client() -> None:
+    """Close the shared ConvertAPI HTTP client."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 async def convert_docx_to_pdf(docx_path: Path, pdf_path: Path) -> Path:
     """
     Convert a DOCX file to PDF using ConvertAPI.
     
     ConvertAPI provides a simple REST API:
-    POST https://v2.convertapi.com/convert/docx/to/pdf?Secret=YOUR_SECRET
+    POST https://v2.convertapi.com/convert/docx/to/pdf
+    With Accept: application/octet-stream the response body is the PDF.
     
     Args:
         docx_path: Path to source DOCX file
@@ -44,55 +81,40 @@ async def convert_docx_to_pdf(docx_path: Path, pdf_path: Path) -> Path:
     logger.info(f"Converting {docx_path.name} to PDF using ConvertAPI")
     
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            # ConvertAPI endpoint and authentication
-            api_url = "https://v2.convertapi.com/convert/docx/to/pdf"
-            headers = {
-                "Authorization": f"Bearer {settings.convertapi_secret}"
+        client = await get_convertapi_client()
+        # ConvertAPI endpoint and authentication. Accepting octet-stream
+        # returns the PDF itself as the response body, instead of a JSON
+        # result pointing at a stored copy that needs a second download.
+        api_url = "https://v2.convertapi.com/convert/docx/to/pdf"
+        headers = {
+            "Authorization": f"Bearer {settings.convertapi_secret}",
+            "Accept": "application/octet-stream"
+        }
+        
+        # Upload file and stream the converted PDF to disk, so memory stays
+        # constant whatever the PDF size
+        logger.info("Uploading DOCX and requesting conversion")
+        pdf_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(docx_path, "rb") as f:
+            files = {
+                "File": (docx_path.name, f, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
             }
             
-            # Upload file
-            logger.info("Uploading DOCX and requesting conversion")
-            with open(docx_path, "rb") as f:
-                files = {
-                    "File": (docx_path.name, f, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-                }
-                data = {
-                    "StoreFile": "true"
-                }
-                
-                response = await client.post(api_url, headers=headers, files=files, data=data)
+            async with client.stream("POST", api_url, headers=headers, files=files) as response:
+                if response.is_error:
+                    await response.aread()  # Error handling below reads the body
                 response.raise_for_status()
-            
-            result = response.json()
-            
-            # ConvertAPI response structure: {"Files": [{"FileName": "...", "FileSize": ..., "Url": "..."}]}
-            # Get download URL from response
-            if "Files" not in result or len(result["Files"]) == 0:
-                logger.error(f"Unexpected response structure: {result}")
-                raise PDFConversionError("No files in conversion response")
-            
-            file_info = result["Files"][0]
-            download_url = file_info.get("Url") or file_info.get("url") or file_info.get("FileData")
-            
-            if not download_url:
-                logger.error(f"No download URL found in file info: {file_info}")
-                raise PDFConversionError(f"No download URL in response. Available keys: {list(file_info.keys())}")
-            
-            logger.info(f"Conversion successful, downloading from: {download_url}")
-            
-            # Download PDF
-            pdf_response = await client.get(download_url)
-            pdf_response.raise_for_status()
-            
-            # Save PDF file
-            pdf_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(pdf_path, "wb") as f:
-                f.write(pdf_response.content)
-            
-            logger.info(f"PDF saved successfully to: {pdf_path}")
-            return pdf_path
-            
+                # Disk writes run in a worker thread so they don't stall the event loop
+                out = await asyncio.to_thread(open, pdf_path, "wb")
+                try:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(out.write, chunk)
+                finally:
+                    await asyncio.to_thread(out.close)
+        
+        logger.info(f"PDF saved successfully to: {pdf_path}")
+        return pdf_path
+        
     except httpx.HTTPStatusError as e:
         error_detail = f"HTTP {e.response.status_code}"
         try:
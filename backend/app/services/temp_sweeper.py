@@ -0,0 +1,200 @@
+"""
+Background sweeper for temporary job directories.
+Moves recursive deletes off the request path: callers schedule a directory
+and a single task removes pending directories in batches.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Subdirectory of the temp dir holding hard links for in-flight downloads
+DOWNLOADS_DIRNAME = ".downloads"
+
+
+class TempSweeper:
+    """
+    Coalesces scheduled deletions and removes them in a worker thread.
+
+    Polls every min_interval while there is work, backing off
+    exponentially to max_interval when idle. When ttl_seconds is set, job
+    directories under root whose UUIDv7 name is older than the TTL are
+    also expired every expire_interval seconds, unless is_active reports
+    the job as still queued or running. Download links under
+    DOWNLOADS_DIRNAME expire on the same TTL.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        min_interval: float = 0.025,
+        max_interval: float = 1.0,
+        ttl_seconds: float | None = None,
+        expire_interval: float = 60.0,
+        is_active: Callable[[str], bool] | None = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self._root = root
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._ttl_seconds = ttl_seconds
+        self._expire_interval = expire_interval
+        self._is_active = is_active
+        self._clock = clock  # Wall-clock seconds, comparable with UUIDv7 timestamps
+        self._pending: set[Path] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start the sweeper task."""
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the sweeper and flush anything still pending."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending:
+            batch, self._pending = self._pending, set()
+            await asyncio.to_thread(self._remove_batch, batch)
+
+    def schedule(self, path: Path) -> None:
+        """Schedule a directory for removal. Safe to call from any thread."""
+        if self._loop is None:
+            raise RuntimeError("TempSweeper is not started")
+        self._loop.call_soon_threadsafe(self._pending.add, path)
+
+    async def _run(self) -> None:
+        """Sweep pending directories with an adaptive polling interval."""
+        interval = self._min_interval
+        next_expiry = time.monotonic() + self._expire_interval
+        while True:
+            await asyncio.sleep(interval)
+            if self._ttl_seconds and time.monotonic() >= next_expiry:
+                next_expiry = time.monotonic() + self._expire_interval
+                await asyncio.to_thread(self._expire_old_jobs)
+            
+            if not self._pending:
+                interval = min(interval * 2, self._max_interval)
+                continue
+
+            interval = self._min_interval
+            batch, self._pending = self._pending, set()
+            await asyncio.to_thread(self._remove_batch, batch)
+
+    def _remove_batch(self, batch: set[Path]) -> None:
+        """Remove each directory, then prune parents left empty below root."""
+        # Job IDs are UUIDv7, so name order is creation order - oldest first
+        for path in sorted(batch, key=lambda p: p.name):
+            shutil.rmtree(path, ignore_errors=True)
+            self._prune_empty_parents(path.parent)
+        logger.debug(f"Swept {len(batch)} temp director{'y' if len(batch) == 1 else 'ies'}")
+
+    def _expire_old_jobs(self) -> None:
+        """
+        Remove job directories, and download links left behind when a
+        response's cleanup never ran, that are older than the TTL. Jobs
+        still queued or running keep their inputs.
+        """
+        cutoff_ms = (self._clock() - self._ttl_seconds) * 1000
+        expired = self._expire_dir(self._root, cutoff_ms, self._is_active)
+        expired += self._expire_dir(self._root / DOWNLOADS_DIRNAME, cutoff_ms, None)
+        
+        if expired:
+            logger.info(f"Expired {expired} temp director{'y' if expired == 1 else 'ies'} older than TTL")
+
+    @staticmethod
+    def _expire_dir(
+        directory: Path,
+        cutoff_ms: float,
+        is_active: Callable[[str], bool] | None
+    ) -> int:
+        """
+        Remove UUIDv7-named subdirectories created before cutoff_ms. The age
+        comes from the name, so no stat() calls are needed; names sort by
+        creation time, so the scan stops at the first young entry.
+        """
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return 0
+        
+        expired = 0
+        for name in names:
+            created_ms = job_id_timestamp_ms(name)
+            if created_ms is None:
+                continue  # Not a UUIDv7-named directory
+            if created_ms >= cutoff_ms:
+                break
+            if is_active and is_active(name):
+                continue
+            shutil.rmtree(directory / name, ignore_errors=True)
+            expired += 1
+        return expired
+
+    def _prune_empty_parents(self, path: Path) -> None:
+        """Remove empty directories from path upwards, stopping at root."""
+        root = self._root.resolve()
+        current = path.resolve()
+        while current != root and root in current.parents:
+            try:
+                os.rmdir(current)
+            except OSError:
+                break  # Not empty (or already gone)
+            current = current.parent
+
+
+def job_id_timestamp_ms(name: str) -> int | None:
+    """Creation time (Unix ms) encoded in a UUIDv7 job ID, or None."""
+    try:
+        job_uuid = uuid.UUID(name)
+    except ValueError:
+        return None
+    if job_uuid.version != 7:
+        return None
+    return job_uuid.int >> 80
+
+
+_sweeper: TempSweeper | None = None
+
+
+async def start_sweeper(
+    root: Path,
+    ttl_seconds: float | None = None,
+    is_active: Callable[[str], bool] | None = None
+) -> None:
+    """Start the shared temp directory sweeper."""
+    global _sweeper
+    _sweeper = TempSweeper(root, ttl_seconds=ttl_seconds, is_active=is_active)
+    await _sweeper.start()
+
+
+async def stop_sweeper() -> None:
+    """Stop the shared sweeper, flushing pending removals."""
+    global _sweeper
+    if _sweeper:
+        await _sweeper.stop()
+        _sweeper = None
+
+
+def schedule_removal(path: Path) -> None:
+    """
+    Schedule a directory for background removal.
+    Falls back to removing it inline when the sweeper isn't running.
+    """
+    if _sweeper and _sweeper.running:
+        _sweeper.schedule(path)
+    elif path.exists():
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,519 @@
+"""
+Tests for the AI section mapper.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from app.core.config import Settings
+from app.services import ai_mapper
+from app.services.analyzer import TemplateAnalysis, TemplateSection
+from app.services.parser import ContentBlock, ExtractedContent
+
+
+class _FakeStream:
+    """
+    Async iterator shaped like a streamed Groq chat completion. Its choices
+    also let it stand in for an unstreamed one (JSON mode requests).
+    """
+
+    def __init__(self, text: str, fragment_size: int = 7, delay: float = 0.0):
+        self._text = text
+        self._fragment_size = fragment_size
+        self._delay = delay
+        self.closed = False
+        self.choices = [SimpleNamespace(message=SimpleNamespace(content=text))]
+
+    async def __aiter__(self):
+        for start in range(0, len(self._text), self._fragment_size):
+            await asyncio.sleep(self._delay)
+            delta = SimpleNamespace(content=self._text[start:start + self._fragment_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def analysis():
+    section = TemplateSection(
+        section_id="sec_all",
+        heading_text="Document",
+        heading_paragraph_idx=-1,
+        body_start_idx=0,
+        body_end_idx=1,
+        body_preview="",
+        section_type="section",
+    )
+    return TemplateAnalysis(
+        sections=[section],
+        section_ids=["sec_all"],
+        template_file="template.docx",
+        total_paragraphs=1,
+    )
+
+
+@pytest.fixture
+def content():
+    return ExtractedContent(
+        blocks=[
+            ContentBlock(id="b0", type="heading", content="Project Overview"),
+            ContentBlock(id="b1", type="paragraph", content="Some body text."),
+        ],
+        source_file="source.docx",
+    )
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    """Stub out settings and the Groq call, counting API invocations."""
+    settings = Settings(groq_api_key="test-key")
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: settings)
+    monkeypatch.setattr(ai_mapper, "_mapping_cache", ai_mapper.MappingCache(maxsize=16, ttl_seconds=60))
+    monkeypatch.setattr(ai_mapper, "_chunk_cache", ai_mapper.MappingCache(maxsize=16, ttl_seconds=60))
+    monkeypatch.setattr(ai_mapper, "_groq_breaker", ai_mapper.CircuitBreaker("Groq"))
+
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _FakeStream(
+            '[{"title": "Project Overview", "body": [{"type": "text", "content": "Some body text."}]}]'
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(ai_mapper, "get_groq_client", get_client)
+    return calls
+
+
+def test_repeat_mapping_is_served_from_cache(fake_groq, content, analysis):
+    first = asyncio.run(ai_mapper.map_content_to_sections(content, analysis))
+    second = asyncio.run(ai_mapper.map_content_to_sections(content, analysis))
+
+    assert len(fake_groq) == 1
+    assert first.mappings == second.mappings
+    assert first.mappings["sections"][0]["title"] == "Project Overview"
+
+
+@pytest.mark.parametrize(
+    "response_text",
+    [
+        '[{"title": "A", "body": []}]',
+        '{"sections": [{"title": "A", "body": []}]}',
+        '```json\n[{"title": "A", "body": []}]\n```',
+        '  ```\n{"sections": [{"title": "A", "body": []}]}\n```  ',
+    ],
+)
+def test_parse_ai_response_unwraps_json_mode_object(response_text):
+    assert ai_mapper._parse_ai_response(response_text) == [{"title": "A", "body": []}]
+
+
+def test_fallback_sequential_mapping_distributes_blocks_in_order(analysis):
+    sections = [
+        analysis.sections[0].model_copy(update={"section_id": f"sec_{i}"})
+        for i in range(3)
+    ]
+    multi = analysis.model_copy(update={"sections": sections})
+    content = ExtractedContent(
+        blocks=[ContentBlock(id=f"b{i}", type="paragraph", content=str(i)) for i in range(7)],
+        source_file="source.docx",
+    )
+
+    mapping = ai_mapper._fallback_sequential_mapping(content, multi)
+
+    assert mapping.mappings == {
+        "sec_0": "0\n\n1",
+        "sec_1": "2\n\n3",
+        "sec_2": "4\n\n5\n\n6",
+    }
+
+
+def test_hedged_completion_returns_first_success(monkeypatch):
+    settings = Settings(groq_hedge_after_ms=10)
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: settings)
+    delays = iter([1.0, 0.0])
+
+    async def stream_completion(client, **kwargs):
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        return "slow" if delay else "hedge"
+
+    monkeypatch.setattr(ai_mapper, "_stream_completion", stream_completion)
+
+    assert asyncio.run(ai_mapper._hedged_completion(None)) == "hedge"
+
+
+def test_concurrent_identical_mappings_share_one_call(fake_groq, content, analysis):
+    async def run():
+        return await asyncio.gather(
+            ai_mapper.map_content_to_sections(content, analysis),
+            ai_mapper.map_content_to_sections(content, analysis),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert len(fake_groq) == 1
+    assert first.mappings == second.mappings
+
+
+def test_cancelled_leader_does_not_cancel_waiting_callers():
+    cache = ai_mapper.MappingCache(maxsize=4, ttl_seconds=60)
+    calls = []
+
+    async def factory():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.Event().wait()  # The leader never finishes
+        return {"sections": ["mapped"]}, True
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_compute("key", factory))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_compute("key", factory))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader
+
+    result, leader = asyncio.run(run())
+
+    assert leader.cancelled()
+    assert result == {"sections": ["mapped"]}
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '[{"title": "A {x}", "body": [{"type": "text", "content": "say \\"hi\\" ]"}]}, {"title": "B", "body": []}]',
+        '{"sections": [{"title": "A", "body": []}]}',
+        '```json\n{"note": "see [1] and \\"sections\\"", "meta": {"tags": ["x"]}, "sections": [{"title": "A", "body": []}]}\n```',
+    ],
+)
+def test_stream_completion_decodes_sections_incrementally(text):
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return _FakeStream(text, fragment_size=3)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    completion = asyncio.run(ai_mapper._stream_completion(client, model="m"))
+
+    assert completion.sections == ai_mapper._parse_ai_response(completion.text)
+
+
+def test_losing_hedge_stream_is_closed(monkeypatch):
+    settings = Settings(groq_hedge_after_ms=10)
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: settings)
+    text = '[{"title": "A", "body": []}]'
+    slow, fast = _FakeStream(text, delay=1.0), _FakeStream(text)
+    streams = iter([slow, fast])
+
+    async def create(**kwargs):
+        return next(streams)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    completion = asyncio.run(ai_mapper._hedged_completion(client, model="m"))
+
+    assert completion.sections == [{"title": "A", "body": []}]
+    assert slow.closed and fast.closed
+
+
+def test_cancelled_caller_closes_primary_stream_before_hedging(monkeypatch):
+    settings = Settings(groq_hedge_after_ms=1000)
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: settings)
+    stream = _FakeStream('[{"title": "A", "body": []}]', delay=10.0)
+
+    async def create(**kwargs):
+        return stream
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def run():
+        caller = asyncio.create_task(ai_mapper._hedged_completion(client, model="m"))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0.01)  # Let the cancelled request unwind
+        return stream.closed
+
+    assert asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"title": "A", "body": "no array"}',
+        '{"items": [{"title": "A", "body": []}]}',
+        '{"title": "[{\\"x\\": 1}]", "sections": "none"}',
+    ],
+)
+def test_stream_completion_flags_non_array_output(text):
+    async def create(**kwargs):
+        return _FakeStream(text)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    completion = asyncio.run(ai_mapper._stream_completion(client, model="m"))
+
+    assert completion.sections is None
+
+
+def _install_client(monkeypatch, create):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(ai_mapper, "get_groq_client", get_client)
+
+
+def test_non_retryable_api_error_falls_back_without_retrying(fake_groq, monkeypatch, content, analysis):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        response = httpx.Response(401, request=httpx.Request("POST", "https://api.groq.com"))
+        raise groq.AuthenticationError("invalid api key", response=response, body=None)
+
+    _install_client(monkeypatch, create)
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, max_retries=2))
+
+    assert len(calls) == 1
+    assert result.mappings["sections"][0]["title"] == "Section 1"
+
+
+def test_invalid_json_is_retried_with_corrective_message(fake_groq, monkeypatch, content, analysis):
+    calls = []
+    responses = iter([
+        "not json at all",
+        '[{"title": "Project Overview", "body": []}]',
+    ])
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _FakeStream(next(responses))
+
+    _install_client(monkeypatch, create)
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis))
+
+    assert len(calls) == 2
+    assert calls[0]["response_format"] == {"type": "json_object"}
+    assert "stream" not in calls[0]  # Streaming isn't combined with JSON mode
+    assert calls[1]["messages"][-1] is ai_mapper._CORRECTIVE_MESSAGE
+    assert result.mappings["sections"][0]["title"] == "Project Overview"
+
+
+def test_empty_sections_fall_back_and_are_not_cached(fake_groq, monkeypatch, content, analysis):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _FakeStream('{"sections": []}')
+
+    _install_client(monkeypatch, create)
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, max_retries=1))
+
+    assert len(calls) == 2
+    assert result.mappings["sections"][0]["title"] == "Section 1"
+    assert [item["content"] for item in result.mappings["sections"][0]["body"]] == [
+        "Project Overview", "Some body text."
+    ]
+    assert len(ai_mapper._chunk_cache._entries) == 0
+
+
+def test_retry_delay_backs_off_and_honours_retry_after(monkeypatch):
+    settings = Settings(groq_retry_base_delay=1.0, groq_retry_max_delay=5.0)
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: settings)
+
+    assert 1.0 <= ai_mapper._retry_delay(0) <= 2.0
+    assert 4.0 <= ai_mapper._retry_delay(2) <= 5.0
+
+    response = httpx.Response(
+        429, headers={"retry-after": "3"}, request=httpx.Request("POST", "https://api.groq.com")
+    )
+    error = groq.RateLimitError("rate limited", response=response, body=None)
+    assert ai_mapper._retry_delay(0, error) == 3.0
+
+
+def test_chunks_are_mapped_concurrently_and_merged_in_order(fake_groq, monkeypatch, analysis):
+    in_flight = 0
+    peak = 0
+
+    async def create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        text = kwargs["messages"][1]["content"].split("] ", 1)[1].split("\n", 1)[0]
+        return _FakeStream(f'{{"sections": [{{"title": "{text}", "body": []}}]}}')
+
+    _install_client(monkeypatch, create)
+    content = ExtractedContent(
+        blocks=[ContentBlock(id=f"b{i}", type="paragraph", content=f"Part {i}") for i in range(3)],
+        source_file="source.docx",
+    )
+
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, chunk_size=1))
+
+    assert peak > 1
+    assert [s["title"] for s in result.mappings["sections"]] == ["Part 0", "Part 1", "Part 2"]
+
+
+def test_output_token_budget_scales_with_input_and_is_capped():
+    short = ai_mapper._output_token_budget("x" * 300, limit=32768)
+    long = ai_mapper._output_token_budget("x" * 30000, limit=32768)
+
+    assert short == int(100 * 1.5) + 512
+    assert short < long
+    assert ai_mapper._output_token_budget("x" * 300000, limit=32768) == 32768
+
+
+def test_open_circuit_skips_groq_and_falls_back(fake_groq, monkeypatch, content, analysis):
+    monkeypatch.setattr(
+        ai_mapper, "_groq_breaker", ai_mapper.CircuitBreaker("Groq", failure_threshold=2, reset_seconds=60)
+    )
+    monkeypatch.setattr(ai_mapper, "_retry_delay", lambda attempt, error=None: 0)
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        response = httpx.Response(503, request=httpx.Request("POST", "https://api.groq.com"))
+        raise groq.InternalServerError("unavailable", response=response, body=None)
+
+    _install_client(monkeypatch, create)
+    first = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, max_retries=2))
+    second = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, max_retries=2))
+
+    assert len(calls) == 2  # The breaker opened before the third attempt
+    assert first.mappings == second.mappings
+    assert second.mappings["sections"][0]["title"] == "Section 1"
+
+
+def test_unexpected_chunk_error_only_degrades_that_chunk(fake_groq, monkeypatch, analysis):
+    real_map_chunk = ai_mapper._map_chunk
+
+    async def flaky_map_chunk(client, chunk_idx, *args, **kwargs):
+        if chunk_idx == 1:
+            raise RuntimeError("boom")
+        return await real_map_chunk(client, chunk_idx, *args, **kwargs)
+
+    monkeypatch.setattr(ai_mapper, "_map_chunk", flaky_map_chunk)
+    content = ExtractedContent(
+        blocks=[ContentBlock(id=f"b{i}", type="paragraph", content=f"Part {i}") for i in range(2)],
+        source_file="source.docx",
+    )
+
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, chunk_size=1))
+
+    titles = [s["title"] for s in result.mappings["sections"]]
+    assert titles == ["Project Overview", "Section 2"]
+
+
+def test_edited_document_only_remaps_changed_chunks(fake_groq, analysis):
+    blocks = [ContentBlock(id=f"b{i}", type="paragraph", content=f"Part {i}") for i in range(3)]
+    original = ExtractedContent(blocks=blocks, source_file="source.docx")
+    edited = original.model_copy(
+        update={"blocks": [*blocks[:2], ContentBlock(id="b2", type="paragraph", content="Part 2, revised")]}
+    )
+
+    asyncio.run(ai_mapper.map_content_to_sections(original, analysis, chunk_size=1))
+    asyncio.run(ai_mapper.map_content_to_sections(edited, analysis, chunk_size=1))
+
+    assert len(fake_groq) == 4
+
+
+def test_marshaled_chunks_share_one_request(fake_groq, monkeypatch, analysis):
+    monkeypatch.setattr(ai_mapper, "get_settings", lambda: Settings(groq_api_key="test-key", groq_marshal_size=2))
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        user = kwargs["messages"][-1]["content"]
+        if kwargs["messages"][1]["content"] == ai_mapper._MARSHAL_SYSTEM_PROMPT:
+            return _FakeStream(
+                '{"chunks": [[{"title": "Part 0", "body": []}], [{"title": "Part 1", "body": []}]]}'
+            )
+        title = user.split("] ", 1)[1].split("\n", 1)[0]
+        return _FakeStream(f'{{"sections": [{{"title": "{title}", "body": []}}]}}')
+
+    _install_client(monkeypatch, create)
+    content = ExtractedContent(
+        blocks=[ContentBlock(id=f"b{i}", type="paragraph", content=f"Part {i}") for i in range(3)],
+        source_file="source.docx",
+    )
+
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis, chunk_size=1))
+
+    assert len(calls) == 2  # One marshaled request for chunks 1-2, one single request for chunk 3
+    assert [s["title"] for s in result.mappings["sections"]] == ["Part 0", "Part 1", "Part 2"]
+
+
+def test_schema_mismatch_is_retried(fake_groq, monkeypatch, content, analysis):
+    calls = []
+    responses = iter([
+        '{"sections": [{"title": "A", "body": [{"type": "text"}]}]}',  # body item without content
+        '{"sections": [{"title": "Project Overview", "body": []}]}',
+    ])
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _FakeStream(next(responses))
+
+    _install_client(monkeypatch, create)
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis))
+
+    assert len(calls) == 2
+    assert result.mappings["sections"] == [{"title": "Project Overview", "body": []}]
+
+
+def test_chunk_over_context_window_is_split_in_half(fake_groq, monkeypatch, analysis):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        lines = [line for line in kwargs["messages"][-1]["content"].split("\n") if line.startswith("[")]
+        if len(lines) > 1:
+            response = httpx.Response(400, request=httpx.Request("POST", "https://api.groq.com"))
+            body = {"error": {"code": "context_length_exceeded"}}
+            raise groq.BadRequestError("context length exceeded", response=response, body=body)
+        title = lines[0].split("] ", 1)[1]
+        return _FakeStream(f'{{"sections": [{{"title": "{title}", "body": []}}]}}')
+
+    _install_client(monkeypatch, create)
+    content = ExtractedContent(
+        blocks=[ContentBlock(id=f"b{i}", type="paragraph", content=f"Part {i}") for i in range(3)],
+        source_file="source.docx",
+    )
+
+    result = asyncio.run(ai_mapper.map_content_to_sections(content, analysis))
+
+    assert [s["title"] for s in result.mappings["sections"]] == ["Part 0", "Part 1", "Part 2"]
+    assert len(calls) == 5  # 3 blocks -> [1] + [2 -> 1 + 1]
+
+
+def test_merge_joins_sections_across_chunks_by_title():
+    merged = ai_mapper._merge_section_mappings([
+        [{"title": "Intro", "body": "first"}, {"title": "Skills", "body": [{"type": "bullet", "content": "a"}]}],
+        [{"title": "skills ", "body": [{"type": "bullet", "content": "b"}]}, {"title": "Intro", "body": []}],
+    ])
+
+    assert merged == [
+        {"title": "Intro", "body": [{"type": "text", "content": "first"}]},
+        {"title": "Skills", "body": [{"type": "bullet", "content": "a"}, {"type": "bullet", "content": "b"}]},
+    ]
+
+
+def test_chunking_respects_token_budget_and_block_cap():
+    blocks = [ContentBlock(id=f"b{i}", type="paragraph", content="x" * 30) for i in range(6)]
+
+    chunks = ai_mapper._chunk_content_blocks(blocks, chunk_size=4, token_budget=25)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2]  # 10 tokens per block
+
+    chunks = ai_mapper._chunk_content_blocks(blocks, chunk_size=4, token_budget=1000)
+    assert [len(chunk) for chunk in chunks] == [4, 2]
@@ -0,0 +1,129 @@
+"""
+Tests for the template analyzer.
+"""
+import asyncio
+
+import fitz
+from docx import Document
+from docx.shared import Pt, RGBColor
+from pptx import Presentation
+from pptx.util import Inches
+
+from app.services import analyzer
+from app.core.exceptions import UnsupportedFileTypeError
+from app.services.analyzer import TemplateAnalysis, analyze_template, analyze_templates
+
+
+def test_docx_template_dna_uses_first_heading_and_following_body(tmp_path):
+    doc = Document()
+    doc.add_paragraph("Cover Title", style="Title")
+    doc.add_paragraph("")
+    doc.add_heading("Introduction", 1)
+    doc.add_paragraph("Body text.")
+    path = tmp_path / "template.docx"
+    doc.save(path)
+
+    analysis = analyze_template(path)
+
+    dna = analysis.template_dna
+    assert dna.heading_style_name == "Heading 1"
+    assert dna.body_style_name == "Normal"
+    assert dna.safe_zone_end_idx == 2
+    assert dna.first_content_section_idx == 2
+    assert analysis.total_paragraphs == 4
+    assert analysis.section_ids == ["sec_all"]
+
+
+def test_docx_template_dna_reads_run_fonts(tmp_path):
+    doc = Document()
+    heading = doc.add_heading("", 1).add_run("Introduction")
+    heading.font.name = "Georgia"
+    heading.font.size = Pt(20)
+    heading.font.color.rgb = RGBColor(0x1F, 0x3A, 0x5F)
+    body = doc.add_paragraph().add_run("Body text.")
+    body.font.size = Pt(11)
+    body.font.bold = False
+    body.font.italic = True
+    path = tmp_path / "template.docx"
+    doc.save(path)
+
+    dna = analyze_template(path).template_dna
+
+    assert (dna.heading_font_name, dna.heading_font_size, dna.heading_font_color) == ("Georgia", 20, "1F3A5F")
+    assert (dna.body_font_name, dna.body_font_size, dna.body_font_color) == (None, 11, None)
+    assert (dna.body_font_bold, dna.body_font_italic) == (False, True)
+
+def test_pptx_sections_take_title_and_first_body_text(tmp_path):
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])  # Title only
+    slide.shapes.add_textbox(0, 0, Inches(2), Inches(1)).text_frame.text = ""
+    slide.shapes.title.text = "Roadmap"
+    slide.shapes.add_textbox(0, 0, Inches(2), Inches(1)).text_frame.text = "First box"
+    slide.shapes.add_textbox(0, 0, Inches(2), Inches(1)).text_frame.text = "Second box"
+    prs.slides.add_slide(prs.slide_layouts[6])  # Blank
+    path = tmp_path / "template.pptx"
+    prs.save(path)
+
+    analysis = analyze_template(path)
+
+    assert [s.heading_text for s in analysis.sections] == ["Roadmap", "Slide 2"]
+    assert [s.body_preview for s in analysis.sections] == ["First box", ""]
+
+
+def test_pdf_sections_read_top_of_page(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Quarterly Report")
+    page.insert_text((72, 90), "Summary line")
+    page.insert_text((72, 700), "Footer text far down the page")
+    page = doc.new_page()
+    page.insert_text((72, 400), "Appendix")
+    doc.new_page()
+    path = tmp_path / "template.pdf"
+    doc.save(path)
+    doc.close()
+
+    analysis = analyze_template(path)
+
+    assert [s.heading_text for s in analysis.sections] == ["Quarterly Report", "Appendix", "Page 3"]
+    assert analysis.sections[0].body_preview == "Summary line"
+
+
+def test_template_analysis_is_cached_by_content(monkeypatch, tmp_path):
+    monkeypatch.setattr(analyzer, "_template_cache", analyzer.OrderedDict())
+    # hashlib.file_digest is 3.11+; the cache key must not depend on it
+    monkeypatch.delattr(analyzer.hashlib, "file_digest", raising=False)
+    calls = []
+    analyze_docx = analyzer._analyze_docx_sections
+    monkeypatch.setattr(analyzer, "_analyze_docx_sections", lambda path: calls.append(path) or analyze_docx(path))
+
+    doc = Document()
+    doc.add_heading("Introduction", 1)
+    doc.add_paragraph("Body text.")
+    paths = [tmp_path / job / "template.docx" for job in ("job-1", "job-2")]
+    for path in paths:
+        path.parent.mkdir()
+    doc.save(paths[0])
+    paths[1].write_bytes(paths[0].read_bytes())
+
+    first = analyze_template(paths[0])
+    first.sections.clear()
+    second = analyze_template(paths[1])
+
+    assert calls == [paths[0]]
+    assert second.section_ids == ["sec_all"]
+    assert second.sections
+
+
+def test_analyze_templates_keeps_order_and_per_file_errors(tmp_path):
+    doc = Document()
+    doc.add_heading("Introduction", 1)
+    docx_path = tmp_path / "template.docx"
+    doc.save(docx_path)
+    txt_path = tmp_path / "template.txt"
+    txt_path.write_text("not a template")
+
+    results = asyncio.run(analyze_templates([txt_path, docx_path], max_concurrency=1))
+
+    assert isinstance(results[0], UnsupportedFileTypeError)
+    assert isinstance(results[1], TemplateAnalysis)
@@ -0,0 +1,136 @@
+"""
+Tests for the document processing API endpoints.
+"""
+import asyncio
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.api.endpoints import save_upload
+from app.core.config import Settings
+from app.core.exceptions import FileTooLargeError
+from app.main import app
+from app.services.temp_sweeper import DOWNLOADS_DIRNAME, TempSweeper, job_id_timestamp_ms
+
+
+@pytest.fixture
+def client():
+    """Test client for the FastAPI app (runs lifespan so the job queue exists)."""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+class TestUploads:
+    """Tests for upload handling in /api/process."""
+
+    def test_rejects_unsupported_extension(self, client):
+        files = {
+            "normal_file": ("source.txt", b"hello", "text/plain"),
+            "target_file": ("template.docx", b"x", "application/octet-stream"),
+        }
+        response = client.post("/api/process", files=files)
+        assert response.status_code == 400
+        assert "Unsupported file type" in response.json()["detail"]
+
+    def test_rejects_oversized_upload(self, monkeypatch, tmp_path):
+        settings = Settings(max_file_size_mb=0, temp_dir=str(tmp_path))
+        monkeypatch.setattr("app.main.get_settings", lambda: settings)
+
+        files = {
+            "normal_file": ("source.docx", b"x" * 16, "application/octet-stream"),
+            "target_file": ("template.docx", b"x" * 16, "application/octet-stream"),
+        }
+        with TestClient(app) as test_client:
+            response = test_client.post("/api/process", files=files)
+        assert response.status_code == 413
+        assert "maximum size" in response.json()["detail"]
+
+
+class TestJobStatus:
+    """Tests for /api/status polling."""
+
+    def test_unknown_job_returns_404(self, client):
+        response = client.get("/api/status/does-not-exist")
+        assert response.status_code == 404
+
+
+class TestDownload:
+    """Tests for /api/download."""
+
+    def test_download_serves_file_and_cleans_up_job(self, monkeypatch, tmp_path):
+        settings = Settings(temp_dir=str(tmp_path))
+        monkeypatch.setattr("app.main.get_settings", lambda: settings)
+        job_dir = tmp_path / "job-1"
+        job_dir.mkdir()
+        (job_dir / "output.docx").write_bytes(b"document-bytes")
+
+        with TestClient(app) as test_client:
+            response = test_client.get("/api/download/job-1/output.docx")
+            assert response.status_code == 200
+            assert response.content == b"document-bytes"
+
+        assert not job_dir.exists()
+
+    def test_leaked_download_link_expires_with_ttl(self, monkeypatch, tmp_path):
+        """A link whose post-response cleanup never ran is swept on the job TTL."""
+        settings = Settings(temp_dir=str(tmp_path))
+        monkeypatch.setattr("app.main.get_settings", lambda: settings)
+        monkeypatch.setattr(endpoints, "schedule_removal", lambda path: None)
+        job_dir = tmp_path / "job-1"
+        job_dir.mkdir()
+        (job_dir / "output.docx").write_bytes(b"document-bytes")
+
+        with TestClient(app) as test_client:
+            assert test_client.get("/api/download/job-1/output.docx").status_code == 200
+
+            (link_dir,) = (tmp_path / DOWNLOADS_DIRNAME).iterdir()
+            created = job_id_timestamp_ms(link_dir.name) / 1000
+            sweeper = TempSweeper(tmp_path, ttl_seconds=60, clock=lambda: created + 120)
+            sweeper._expire_old_jobs()
+
+            assert not link_dir.exists()
+
+
+class TestSaveUpload:
+    """Tests for save_upload."""
+
+    @pytest.mark.parametrize("size", [1024, 2 * 1024 * 1024])
+    def test_saves_in_memory_and_spooled_uploads(self, tmp_path, size):
+        data = bytes(range(256)) * (size // 256)
+        with SpooledTemporaryFile(max_size=1024 * 1024) as spooled:
+            spooled.write(data)
+            spooled.seek(0)
+            upload = UploadFile(file=spooled, filename="source.DOCX")
+
+            path = asyncio.run(save_upload(upload, tmp_path, "source", max_bytes=4 * 1024 * 1024))
+
+        assert path == tmp_path / "source.docx"
+        assert path.read_bytes() == data
+
+    def test_rejects_oversized_spooled_upload(self, tmp_path):
+        with SpooledTemporaryFile(max_size=1024) as spooled:
+            spooled.write(b"x" * 4096)
+            spooled.seek(0)
+            upload = UploadFile(file=spooled, filename="source.docx")
+
+            with pytest.raises(FileTooLargeError):
+                asyncio.run(save_upload(upload, tmp_path, "source", max_bytes=2048))
+
+    def test_spooled_upload_falls_back_when_sendfile_fails(self, tmp_path, monkeypatch):
+        def sendfile(*args):
+            raise OSError("sendfile not supported")
+
+        monkeypatch.setattr(endpoints, "_SENDFILE_TO_FILE", True)
+        monkeypatch.setattr(endpoints.os, "sendfile", sendfile, raising=False)
+        data = bytes(range(256)) * 16
+        with SpooledTemporaryFile(max_size=1024) as spooled:
+            spooled.write(data)
+            spooled.seek(0)
+            upload = UploadFile(file=spooled, filename="source.docx")
+
+            path = asyncio.run(save_upload(upload, tmp_path, "source", max_bytes=1024 * 1024))
+
+        assert path.read_bytes() == data
@@ -0,0 +1,59 @@
+"""
+Tests for the in-process job queue.
+"""
+import asyncio
+import uuid
+
+from app.services.job_queue import JobQueue, JobStatus
+
+NOW = 1_700_000_000.0
+
+
+def _job_id(created_at: float, seq: int = 0) -> str:
+    """A UUIDv7 job ID whose timestamp is created_at (Unix seconds)."""
+    return str(uuid.UUID(int=(int(created_at * 1000) << 80) | (0x7 << 76) | (0x2 << 62) | seq))
+
+
+def test_jobs_complete_and_fail():
+    """Workers record download URLs on success and formatted errors on failure."""
+
+    async def handler(job_id, payload):
+        if payload["fail"]:
+            raise ValueError("boom")
+        return f"/api/download/{job_id}/out.docx"
+
+    async def run():
+        queue = JobQueue(handler=handler, concurrency=2, error_formatter=lambda e: f"failed: {e}")
+        await queue.start()
+        await queue.submit("ok", {"fail": False})
+        await queue.submit("bad", {"fail": True})
+        await queue._queue.join()
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(run())
+
+    assert queue.get("ok").status == "completed"
+    assert queue.get("ok").download_url == "/api/download/ok/out.docx"
+    assert queue.get("bad").status == "failed"
+    assert queue.get("bad").error == "failed: boom"
+    assert not queue.is_active("ok")
+
+
+def test_finished_jobs_expire_after_ttl():
+    """Finished statuses older than the TTL are dropped; active and young ones stay."""
+
+    async def handler(job_id, payload):
+        return ""
+
+    queue = JobQueue(handler=handler, concurrency=1, ttl_seconds=60, clock=lambda: NOW)
+    old_done, old_active = _job_id(NOW - 120, 1), _job_id(NOW - 120, 2)
+    new_done = _job_id(NOW - 30)
+    queue.jobs[old_done] = JobStatus(job_id=old_done, status="completed")
+    queue.jobs[old_active] = JobStatus(job_id=old_active, status="processing")
+    queue.jobs[new_done] = JobStatus(job_id=new_done, status="completed")
+
+    assert queue.get(old_done) is None
+    assert queue.get(old_active).status == "processing"
+    assert queue.is_active(old_active)
+    assert queue.get(new_done).status == "completed"
@@ -0,0 +1,78 @@
+"""
+Tests for source content extraction.
+"""
+import fitz
+import pytest
+from docx import Document
+from pptx import Presentation
+from pptx.util import Inches
+
+from app.core.config import Settings
+from app.services import parser
+from app.services.parser import extract_content
+
+
+@pytest.fixture
+def long_pdf(tmp_path):
+    doc = fitz.open()
+    for page_no in range(5):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"SECTION {page_no}")
+        page.insert_text((72, 200), f"Paragraph text on page {page_no}.")
+        page.insert_text((72, 300), f"- item {page_no}")
+    path = tmp_path / "source.pdf"
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_pdf_extraction_in_process_pool_matches_sequential(monkeypatch, long_pdf):
+    monkeypatch.setattr(parser, "get_settings", lambda: Settings(pdf_extract_workers=0))
+    sequential = extract_content(long_pdf)
+
+    monkeypatch.setattr(
+        parser, "get_settings",
+        lambda: Settings(pdf_extract_workers=2, pdf_extract_parallel_min_pages=2)
+    )
+    try:
+        pooled = extract_content(long_pdf)
+    finally:
+        parser.shutdown_pdf_pool()
+
+    assert pooled == sequential
+    assert [b.id for b in pooled.blocks] == [f"b{i}" for i in range(15)]
+    assert [b.type for b in pooled.blocks[:3]] == ["heading", "paragraph", "list"]
+
+
+def test_pptx_extraction_handles_text_boxes(tmp_path):
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])  # Title only
+    slide.shapes.title.text = "Roadmap"
+    frame = slide.shapes.add_textbox(0, 0, Inches(2), Inches(1)).text_frame
+    frame.text = "Goals"
+    item = frame.add_paragraph()
+    item.text = "Ship it"
+    item.level = 1
+    path = tmp_path / "source.pptx"
+    prs.save(path)
+
+    content = extract_content(path)
+
+    assert [(b.type, b.content) for b in content.blocks] == [
+        ("heading", "Roadmap"), ("paragraph", "Goals"), ("list", "Ship it")
+    ]
+
+
+def test_docx_extraction_classifies_by_style(tmp_path):
+    doc = Document()
+    doc.add_heading("Overview", 1)
+    doc.add_paragraph("Plain text.")
+    doc.add_paragraph("First point", style="List Bullet")
+    doc.add_paragraph("- dashed point")
+    doc.add_heading("Details", 1)
+    path = tmp_path / "source.docx"
+    doc.save(path)
+
+    content = extract_content(path)
+
+    assert [b.type for b in content.blocks] == ["heading", "paragraph", "list", "list", "heading"]
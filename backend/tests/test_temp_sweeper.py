@@ -0,0 +1,94 @@
+"""
+Tests for the temp directory sweeper.
+"""
+import asyncio
+import uuid
+
+from app.services.temp_sweeper import DOWNLOADS_DIRNAME, TempSweeper
+
+NOW = 1_700_000_000.0
+
+
+def _job_id(created_at: float, seq: int = 0) -> str:
+    """A UUIDv7 job ID whose timestamp is created_at (Unix seconds)."""
+    return str(uuid.UUID(int=(int(created_at * 1000) << 80) | (0x7 << 76) | (0x2 << 62) | seq))
+
+
+def test_scheduled_directories_are_removed(tmp_path):
+    job_dir = tmp_path / "job-1"
+    (job_dir / "nested").mkdir(parents=True)
+    (job_dir / "nested" / "output.docx").write_bytes(b"data")
+
+    async def run():
+        sweeper = TempSweeper(tmp_path, min_interval=0.001, max_interval=0.01)
+        await sweeper.start()
+        sweeper.schedule(job_dir)
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if not job_dir.exists():
+                break
+        await sweeper.stop()
+
+    asyncio.run(run())
+    assert not job_dir.exists()
+    assert tmp_path.exists()
+
+
+def test_stop_flushes_pending_removals(tmp_path):
+    job_dir = tmp_path / "job-2"
+    job_dir.mkdir()
+
+    async def run():
+        sweeper = TempSweeper(tmp_path, min_interval=60, max_interval=60)
+        await sweeper.start()
+        sweeper.schedule(job_dir)
+        await asyncio.sleep(0)
+        await sweeper.stop()
+
+    asyncio.run(run())
+    assert not job_dir.exists()
+
+
+def test_expires_only_jobs_older_than_ttl(tmp_path):
+    old_job = tmp_path / _job_id(NOW - 120)
+    old_job.mkdir()
+    new_job = tmp_path / _job_id(NOW - 30)
+    new_job.mkdir()
+    other = tmp_path / ".downloads"
+    other.mkdir()
+
+    sweeper = TempSweeper(tmp_path, ttl_seconds=60, clock=lambda: NOW)
+    sweeper._expire_old_jobs()
+
+    assert not old_job.exists()
+    assert new_job.exists()
+    assert other.exists()
+
+
+def test_expiry_skips_active_jobs(tmp_path):
+    active_job = tmp_path / _job_id(NOW - 120, 1)
+    active_job.mkdir()
+    done_job = tmp_path / _job_id(NOW - 120, 2)
+    done_job.mkdir()
+
+    sweeper = TempSweeper(
+        tmp_path, ttl_seconds=60, is_active=lambda job_id: job_id == active_job.name, clock=lambda: NOW
+    )
+    sweeper._expire_old_jobs()
+
+    assert active_job.exists()
+    assert not done_job.exists()
+
+
+def test_expires_download_links_older_than_ttl(tmp_path):
+    old_link = tmp_path / DOWNLOADS_DIRNAME / _job_id(NOW - 120)
+    old_link.mkdir(parents=True)
+    (old_link / "output.docx").write_bytes(b"data")
+    new_link = tmp_path / DOWNLOADS_DIRNAME / _job_id(NOW - 30)
+    new_link.mkdir()
+
+    sweeper = TempSweeper(tmp_path, ttl_seconds=60, is_active=lambda job_id: True, clock=lambda: NOW)
+    sweeper._expire_old_jobs()
+
+    assert not old_link.exists()
+    assert new_link.exists()
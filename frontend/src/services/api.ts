@@ -40,9 +40,16 @@ export async function processDocuments(
 
     const data = await response.json();
     
+    // Backend queues the job and returns a status URL to poll
+    const job = await pollJobStatus(data.status_url || `/api/status/${data.job_id}`);
+    
+    if (job.status === "failed") {
+      throw new Error(job.error || "Failed to process documents");
+    }
+    
     // Backend returns relative URL like /api/download/{job_id}/{filename}
     // Construct full URL
-    const downloadPath = data.download_url || data.downloadUrl;
+    const downloadPath = job.download_url;
     const fullDownloadUrl = downloadPath 
       ? `${API_BASE_URL}${downloadPath}` 
       : undefined;
@@ -60,6 +67,54 @@ export async function processDocuments(
   }
 }
 
+/**
+ * Interval between job status polls (ms)
+ */
+const STATUS_POLL_INTERVAL_MS = 1500;
+
+/**
+ * Longest time to wait for a queued job before giving up (ms)
+ */
+const STATUS_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+interface JobStatusResponse {
+  job_id: string;
+  status: "queued" | "processing" | "completed" | "failed";
+  download_url?: string | null;
+  error?: string | null;
+}
+
+/**
+ * Poll a queued job until it completes or fails
+ * 
+ * @param statusPath - Relative status URL like /api/status/{job_id}
+ * @returns Promise with the final job status
+ * @throws Error if the job hasn't finished within STATUS_POLL_TIMEOUT_MS
+ */
+async function pollJobStatus(statusPath: string): Promise<JobStatusResponse> {
+  const deadline = Date.now() + STATUS_POLL_TIMEOUT_MS;
+
+  for (;;) {
+    const response = await fetch(`${API_BASE_URL}${statusPath}`);
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || `Server error: ${response.status}`);
+    }
+
+    const job: JobStatusResponse = await response.json();
+    if (job.status === "completed" || job.status === "failed") {
+      return job;
+    }
+
+    if (Date.now() + STATUS_POLL_INTERVAL_MS > deadline) {
+      throw new Error("Timed out waiting for the document to be processed");
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, STATUS_POLL_INTERVAL_MS));
+  }
+}
+
 /**
  * Download the processed file
  * 